@@ -0,0 +1,133 @@
+#!/bin/env python3
+"""Visit and student counts rolled up by day and hour, for the Analytics view.
+
+VisitRollups has sign ins by the hour they started, and sign outs and their
+total length in seconds by the hour they ended. StudentRollups has late and
+early students per grade per day. Triggers keep both up to date as visits and
+student events are added, so reading them never scans PastVisitors.
+
+Clearing past visitors leaves the rollups alone. rebuild() recomputes them from
+the history that's left, archives included, a batch of terms at a time; run
+`python analytics.py [database]` to rebuild after upgrading or restoring
+data.db."""
+import datetime
+import logging
+import sys
+
+import archive
+import database
+import migrations
+
+# The same local day and hour the rollup triggers use
+DAY = "date({0}, 'unixepoch', 'localtime')"
+HOUR = "CAST(strftime('%H', {0}, 'unixepoch', 'localtime') AS INTEGER)"
+
+
+def dayOf(epoch: int):
+    """The local "YYYY-MM-DD" day an epoch falls in, as stored in the rollups"""
+    return datetime.datetime.fromtimestamp(epoch).strftime("%Y-%m-%d")
+
+
+def _days(start=None, end=None):
+    # WHERE clauses for [start, end) epochs, which should be midnights
+    clauses, params = [], []
+    if start is not None:
+        clauses.append("Day >= ?")
+        params.append(dayOf(start))
+    if end is not None:
+        clauses.append("Day < ?")
+        params.append(dayOf(end))
+    return f"WHERE {' AND '.join(clauses)}" if clauses else "", params
+
+
+def dailyVisits(path="data.db", start=None, end=None):
+    """(Day, SignIns, SignOuts, average minutes per visit) for each day with
+    any visits, oldest first"""
+    where, params = _days(start, end)
+    return database.getDatabase(path).execute(
+        f"""SELECT Day, SUM(SignIns), SUM(SignOuts),
+        ROUND(SUM(Seconds) / 60.0 / MAX(SUM(SignOuts), 1), 1)
+        FROM VisitRollups {where} GROUP BY Day ORDER BY Day""",
+        *params,
+        fetch=2,
+    )
+
+
+def hourlyVisits(path="data.db", start=None, end=None):
+    """(Hour, SignIns, SignOuts) added up over the days, for busy times"""
+    where, params = _days(start, end)
+    return database.getDatabase(path).execute(
+        f"""SELECT Hour, SUM(SignIns), SUM(SignOuts) FROM VisitRollups {where}
+        GROUP BY Hour ORDER BY Hour""",
+        *params,
+        fetch=2,
+    )
+
+
+def studentsByGrade(path="data.db", start=None, end=None):
+    """(Grade, late, early) student counts, lowest grade first"""
+    where, params = _days(start, end)
+    return database.getDatabase(path).execute(
+        f"""SELECT Grade, SUM(IIF(Type = 'late', Count, 0)), SUM(IIF(Type = 'early', Count, 0))
+        FROM StudentRollups {where} GROUP BY Grade ORDER BY Grade""",
+        *params,
+        fetch=2,
+    )
+
+
+def _addVisitRollups(rollups: dict, conn, names, main=True):
+    # One scan of the visits, grouped by the hours they started and ended in.
+    # There are only a handful of end hours per start hour, so this is small.
+    visits, params = archive.union("EpochIn, EpochOut", ["EpochIn IS NOT NULL"], [], names, main)
+    if main:
+        visits += " UNION ALL SELECT EpochIn, NULL FROM main.Visitors WHERE EpochIn IS NOT NULL"
+    for inDay, inHour, outDay, outHour, count, seconds in conn.execute(
+        f"""SELECT {DAY.format('EpochIn')}, {HOUR.format('EpochIn')},
+        {DAY.format('EpochOut')}, {HOUR.format('EpochOut')},
+        COUNT(*), SUM(MAX(EpochOut - EpochIn, 0))
+        FROM ({visits}) GROUP BY 1, 2, 3, 4""",
+        params,
+    ):
+        rollup = rollups.setdefault((inDay, inHour), [0, 0, 0])
+        rollup[0] += count
+        if outDay is not None:
+            rollup = rollups.setdefault((outDay, outHour), [0, 0, 0])
+            rollup[1] += count
+            rollup[2] += seconds
+
+
+def rebuild(path="data.db"):
+    """Recomputes the rollups from all visit history and student events, in
+    one transaction. Returns how many day/hour rows there are."""
+    db = database.getDatabase(path)
+    rollups = {}
+    # Holding data.db's write lock keeps archiving from moving rows mid count.
+    # The archives are read a batch at a time on a second connection, since
+    # nothing can be attached inside a transaction.
+    with db.transaction() as conn:
+        _addVisitRollups(rollups, conn, [])
+        with db.connection() as reader:
+            for files in archive.batches(archive.archives(path)):
+                if files:
+                    with archive.attached(reader, files) as names:
+                        _addVisitRollups(rollups, reader, names, main=False)
+        rows = [(day, hour, *rollup) for (day, hour), rollup in rollups.items()]
+        conn.execute("DELETE FROM VisitRollups")
+        conn.executemany(
+            "INSERT INTO VisitRollups (Day, Hour, SignIns, SignOuts, Seconds) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+        conn.execute("DELETE FROM StudentRollups")
+        conn.execute(
+            f"""INSERT INTO StudentRollups (Day, Grade, Type, Count)
+            SELECT {DAY.format('Epoch')}, Grade, Type, COUNT(*) FROM StudentEvents
+            GROUP BY 1, 2, 3"""
+        )
+    logging.warning("Rebuilt %s hours of visit analytics", len(rows))
+    return len(rows)
+
+
+if __name__ == "__main__":
+    target = sys.argv[1] if len(sys.argv) > 1 else "data.db"
+    migrations.migrate(target)
+    print(f"Rebuilt {rebuild(target)} hours of visit analytics in {target}")
@@ -0,0 +1,213 @@
+#!/bin/env python3
+"""Moves old visit history out of data.db into one archive database per term.
+
+Terms run January-June ("2025-spring") and July-December ("2025-fall"), by
+when the visit started, and each one is archive/visits-<term>.db next to
+data.db. Rows move a chunk at a time: each chunk is copied and committed, then
+deleted from data.db in a second short transaction. A crash in between leaves
+a chunk in both places rather than neither, and the next run tidies it up.
+
+History queries ATTACH the archives their date range covers and UNION ALL
+them with data.db's PastVisitors, so nothing looks different once it's moved.
+SQLite can only attach so many at once, so a long history is searched a
+batch of terms at a time.
+
+Run `python archive.py [days] [database]` to archive everything older than
+days (the RetentionDays setting if it's left out)."""
+import contextlib
+import datetime
+import logging
+import os
+import sys
+import time
+
+import database
+import migrations
+
+ARCHIVE_DIR = "archive"
+CHUNK = 500
+DEFAULT_RETENTION_DAYS = 365
+# SQLite allows 10 attached databases by default
+ATTACH_LIMIT = 10
+COLUMNS = "Id, FirstName, LastName, TimeIn, TimeOut, DateIn, DateOut, EpochIn, EpochOut"
+
+
+def getRetentionDays(path="data.db"):
+    row = database.getDatabase(path).execute(
+        "SELECT Value FROM Settings WHERE Key = 'RetentionDays'", fetch=1
+    )
+    return int(row[0]) if row else DEFAULT_RETENTION_DAYS
+
+
+def setRetentionDays(days: int, path="data.db"):
+    database.getDatabase(path).execute(
+        "INSERT INTO Settings (Key, Value) VALUES ('RetentionDays', ?) "
+        "ON CONFLICT (Key) DO UPDATE SET Value = excluded.Value",
+        str(days),
+    )
+
+
+def termOf(epoch: int):
+    day = datetime.datetime.fromtimestamp(epoch)
+    return f"{day.year}-{'spring' if day.month <= 6 else 'fall'}"
+
+
+def termBounds(term: str):
+    """The local epochs a term starts at and the next one starts at"""
+    year, half = term.split("-")
+    year = int(year)
+    if half == "spring":
+        start, end = datetime.datetime(year, 1, 1), datetime.datetime(year, 7, 1)
+    else:
+        start, end = datetime.datetime(year, 7, 1), datetime.datetime(year + 1, 1, 1)
+    return int(start.timestamp()), int(end.timestamp())
+
+
+def archiveDir(path="data.db"):
+    return os.path.join(os.path.dirname(os.path.abspath(path)), ARCHIVE_DIR)
+
+
+def archiveFile(path: str, term: str):
+    return os.path.join(archiveDir(path), f"visits-{term}.db")
+
+
+def archives(path="data.db", start=None, end=None):
+    """Archive files for the terms overlapping [start, end), oldest first"""
+    try:
+        names = os.listdir(archiveDir(path))
+    except FileNotFoundError:
+        return []
+    found = []
+    for name in names:
+        if not (name.startswith("visits-") and name.endswith(".db")):
+            continue
+        termStart, termEnd = termBounds(name[len("visits-") : -len(".db")])
+        if (start is None or termEnd > start) and (end is None or termStart < end):
+            found.append((termStart, os.path.join(archiveDir(path), name)))
+    # By date, not name, which would put "2025-fall" before "2025-spring"
+    return [file for _, file in sorted(found)]
+
+
+def batches(files):
+    """files split into lists small enough to attach at once, oldest first.
+    There's always at least one list, even if it's empty."""
+    size = ATTACH_LIMIT - 1
+    return [files[i : i + size] for i in range(0, len(files), size)] or [[]]
+
+
+@contextlib.contextmanager
+def attached(conn, files):
+    """ATTACHes each file to conn for the block and yields their schema names"""
+    if len(files) > ATTACH_LIMIT - 1:
+        raise ValueError(f"Can't search {len(files)} terms at once")
+    names = []
+    try:
+        for file in files:
+            name = f"archive{len(names)}"
+            conn.execute(f"ATTACH DATABASE ? AS {name}", (file,))
+            names.append(name)
+        yield names
+    finally:
+        for name in names:
+            conn.execute(f"DETACH DATABASE {name}")
+
+
+def union(columns: str, clauses, params, names, main=True):
+    """A compound SELECT of columns over data.db's PastVisitors (unless main
+    is False) and each attached archive's, filtered by clauses. Returns (sql,
+    params).
+
+    Rows still in data.db (a chunk caught half moved) are left out of the
+    archives so nothing is counted twice."""
+    where = " AND ".join(clauses)
+    parts = []
+    if main:
+        parts.append(f"SELECT {columns} FROM main.PastVisitors{' WHERE ' + where if where else ''}")
+    for name in names:
+        parts.append(
+            f"SELECT {columns} FROM {name}.PastVisitors WHERE "
+            f"{where + ' AND ' if where else ''}Id NOT IN (SELECT Id FROM main.PastVisitors)"
+        )
+    return " UNION ALL ".join(parts), list(params) * len(parts)
+
+
+def _createArchive(conn, name):
+    conn.execute(
+        f"""CREATE TABLE IF NOT EXISTS {name}.PastVisitors (
+        "Id" INTEGER NOT NULL PRIMARY KEY,
+        "FirstName" TEXT NOT NULL,
+        "LastName" TEXT NOT NULL,
+        "TimeIn" TEXT NOT NULL,
+        "TimeOut" TEXT NOT NULL,
+        "DateIn" TEXT NOT NULL,
+        "DateOut" TEXT NOT NULL,
+        "EpochIn" INTEGER,
+        "EpochOut" INTEGER
+        )"""
+    )
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {name}.PastVisitors_Name ON PastVisitors (LastName, FirstName)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {name}.PastVisitors_EpochIn ON PastVisitors (EpochIn)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {name}.PastVisitors_EpochOut ON PastVisitors (EpochOut)")
+
+
+def _moveTerm(conn, name, start, end, chunk):
+    moved = 0
+    inTerm = "EpochIn >= ? AND EpochIn < ?"
+    while True:
+        last = conn.execute(
+            f"SELECT MAX(Id) FROM (SELECT Id FROM main.PastVisitors WHERE {inTerm} ORDER BY Id LIMIT ?)",
+            (start, end, chunk),
+        ).fetchone()[0]
+        if last is None:
+            return moved
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            f"""INSERT OR IGNORE INTO {name}.PastVisitors ({COLUMNS})
+            SELECT {COLUMNS} FROM main.PastVisitors WHERE {inTerm} AND Id <= ?""",
+            (start, end, last),
+        )
+        conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        moved += conn.execute(
+            f"""DELETE FROM main.PastVisitors WHERE {inTerm} AND Id <= ?
+            AND Id IN (SELECT Id FROM {name}.PastVisitors)""",
+            (start, end, last),
+        ).rowcount
+        conn.commit()
+
+
+def archiveBefore(before: int, path="data.db", chunk=CHUNK):
+    """Moves every visit that started before the epoch `before` into its term's
+    archive, `chunk` rows per transaction. Returns how many were moved."""
+    db = database.getDatabase(path)
+    moved = 0
+    with db.connection() as conn:
+        while True:
+            oldest = conn.execute(
+                "SELECT MIN(EpochIn) FROM PastVisitors WHERE EpochIn < ?", (before,)
+            ).fetchone()[0]
+            if oldest is None:
+                break
+            term = termOf(oldest)
+            start, end = termBounds(term)
+            os.makedirs(archiveDir(path), exist_ok=True)
+            with attached(conn, [archiveFile(path, term)]) as (name,):
+                _createArchive(conn, name)
+                count = _moveTerm(conn, name, start, min(end, before), chunk)
+            logging.warning("Archived %s visits from %s", count, term)
+            moved += count
+    return moved
+
+
+def archiveOld(path="data.db", days=None):
+    """Archives visits older than days, or the RetentionDays setting"""
+    if days is None:
+        days = getRetentionDays(path)
+    return archiveBefore(int(time.time()) - days * 24 * 60 * 60, path)
+
+
+if __name__ == "__main__":
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    target = sys.argv[2] if len(sys.argv) > 2 else "data.db"
+    migrations.migrate(target)
+    print(f"Archived {archiveOld(target, days)} visits from {target}")
@@ -0,0 +1,119 @@
+#!/bin/env python3
+"""Admin accounts and bcrypt password checks.
+
+The bcrypt work factor lives in the Settings table. `python auth.py calibrate
+[milliseconds]` picks the largest factor that hashes within that time on this
+machine, and logins rehash any stored password that uses a different factor."""
+import logging
+import sys
+import time
+
+import database
+import lazy
+import migrations
+
+bcrypt = lazy.lazyImport("bcrypt")
+
+DEFAULT_ROUNDS = 12  # bcrypt.gensalt()'s default
+MIN_ROUNDS = 4
+MAX_ROUNDS = 16
+TARGET_MS = 250
+
+
+def getRounds(passwordHash):
+    """The work factor a hash was made with, read from its "$2b$12$..." prefix"""
+    if isinstance(passwordHash, str):
+        passwordHash = passwordHash.encode()
+    try:
+        return int(passwordHash.split(b"$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def getWorkFactor(path="data.db"):
+    row = database.getDatabase(path).execute(
+        "SELECT Value FROM Settings WHERE Key = 'BcryptRounds'", fetch=1
+    )
+    return int(row[0]) if row else DEFAULT_ROUNDS
+
+
+def setWorkFactor(rounds: int, path="data.db"):
+    database.getDatabase(path).execute(
+        "INSERT INTO Settings (Key, Value) VALUES ('BcryptRounds', ?) "
+        "ON CONFLICT (Key) DO UPDATE SET Value = excluded.Value",
+        str(rounds),
+    )
+
+
+def calibrate(targetMs=TARGET_MS):
+    """Returns the largest work factor that hashes in under targetMs here"""
+    rounds = MIN_ROUNDS
+    while rounds < MAX_ROUNDS:
+        start = time.perf_counter()
+        bcrypt.hashpw(b"calibrate", bcrypt.gensalt(rounds + 1))
+        if (time.perf_counter() - start) * 1000 > targetMs:
+            break
+        rounds += 1
+    return rounds
+
+
+def hashPassword(password: str, rounds: int):
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds)).decode()
+
+
+def loadAdmins(path="data.db"):
+    """Returns {username: password hash} for every admin"""
+    return {
+        username: (
+            passwordHash.decode() if isinstance(passwordHash, bytes) else passwordHash
+        )
+        for username, passwordHash in database.getDatabase(path).execute(
+            "SELECT Username, PasswordHash FROM Admins", fetch=2
+        )
+    }
+
+
+def addAdmin(admins: dict, username: str, password: str, name: str, path="data.db"):
+    username = username.lower()
+    passwordHash = hashPassword(password, getWorkFactor(path))
+    database.getDatabase(path).execute(
+        "INSERT INTO Admins (Name, Username, PasswordHash) VALUES (?, ?, ?)",
+        name,
+        username,
+        passwordHash,
+    )
+    admins[username] = passwordHash
+
+
+def checkLogin(admins: dict, username: str, password: str, path="data.db"):
+    """Checks a password against the admins cache.
+
+    Slow on purpose, so call it off the Tk thread. On success, a hash made with
+    a different work factor than the current one is replaced in the database
+    and the cache."""
+    passwordHash = admins.get(username)
+    if passwordHash is None:
+        return False
+    if not bcrypt.checkpw(password.encode(), passwordHash.encode()):
+        return False
+    rounds = getWorkFactor(path)
+    if getRounds(passwordHash) != rounds:
+        logging.warning("Rehashing %s's password with work factor %s", username, rounds)
+        newHash = hashPassword(password, rounds)
+        database.getDatabase(path).execute(
+            "UPDATE Admins SET PasswordHash = ? WHERE Username = ?", newHash, username
+        )
+        admins[username] = newHash
+    return True
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "calibrate":
+        print("usage: auth.py calibrate [milliseconds] [database]")
+        exit(1)
+    target = int(sys.argv[2]) if len(sys.argv) > 2 else TARGET_MS
+    path = sys.argv[3] if len(sys.argv) > 3 else "data.db"
+    migrations.migrate(path)
+    rounds = calibrate(target)
+    setWorkFactor(rounds, path)
+    print(f"bcrypt work factor set to {rounds} (target {target}ms)")
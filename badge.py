@@ -0,0 +1,63 @@
+"""Badge tokens printed as a barcode on visitor slips.
+
+A token is "V", the visit Id in base 36, "-", and a random secret stored with
+the visit, e.g. "V1Z-K3Q9". Scanning it signs the visit out by primary key; the
+secret just stops anyone signing out a visit by guessing its number."""
+import re
+import secrets
+
+ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+SECRET_LENGTH = 4
+TOKEN = re.compile(r"V([0-9A-Z]+)-([0-9A-Z]{%d})" % SECRET_LENGTH)
+# Scanners type a whole token in well under this between keys; people don't
+MAX_GAP_MS = 50
+
+
+def newSecret():
+    return "".join(secrets.choice(ALPHABET) for i in range(SECRET_LENGTH))
+
+
+def base36(number: int):
+    digits = ""
+    while True:
+        number, digit = divmod(number, 36)
+        digits = ALPHABET[digit] + digits
+        if not number:
+            return digits
+
+
+def makeToken(visitorId: int, secret: str):
+    return f"V{base36(visitorId)}-{secret}"
+
+
+def parseToken(token: str):
+    """Returns (visitorId, secret), or raises ValueError for anything else"""
+    match = TOKEN.fullmatch(token.strip().upper())
+    if match is None:
+        raise ValueError(f"{token!r} is not a badge")
+    return int(match[1], 36), match[2]
+
+
+class ScanBuffer:
+    """Picks barcode scans out of keyboard input.
+
+    A keyboard-wedge scanner types the token then Enter, much faster than
+    anyone types. feed() takes each character with its time in milliseconds and
+    returns the token when a fast burst ending in Enter looks like one."""
+
+    def __init__(self, maxGap=MAX_GAP_MS):
+        self.maxGap = maxGap
+        self._chars = []
+        self._last = None
+
+    def feed(self, char: str, when: int):
+        if self._last is not None and when - self._last > self.maxGap:
+            self._chars.clear()
+        self._last = when
+        if char not in ("\r", "\n"):
+            if char:
+                self._chars.append(char)
+            return None
+        typed = "".join(self._chars)
+        self._chars.clear()
+        return typed if TOKEN.fullmatch(typed.upper()) else None
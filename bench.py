@@ -0,0 +1,470 @@
+#!/bin/env python3
+"""Rough timing benchmarks for the kiosk. Run `python bench.py [name ...]`.
+
+Every benchmark works on a scratch copy of data.db so the real one is never touched."""
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import socket
+import tempfile
+import threading
+import time
+
+import client
+import core
+import database
+import driver
+import journal
+import migrations
+import nameindex
+import printer
+import printerd
+import printqueue
+import roster
+
+
+def scratchDatabase(directory):
+    path = os.path.join(directory, "data.db")
+    shutil.copy("data.db", path)
+    return path
+
+
+def timeit(func, runs):
+    start = time.perf_counter()
+    for i in range(runs):
+        func(i)
+    return (time.perf_counter() - start) / runs
+
+
+def report(name, seconds):
+    print(f"{name:<40}{seconds * 1e6:>12.1f} us/op")
+
+
+def _legacySqldata(command, *replace, database="data.db", fetch=0):
+    # The old connect-per-call sqldata, kept here for comparison
+    CONN = sqlite3.connect(database)
+    CURSOR = CONN.cursor()
+    if not fetch:
+        output = CURSOR.execute(command, replace)
+    elif fetch == 1:
+        output = CURSOR.execute(command, replace).fetchone()
+    else:
+        output = CURSOR.execute(command, replace).fetchall()
+    CURSOR.close()
+    CONN.commit()
+    CONN.close()
+    return output
+
+
+def benchSqldata(runs=500):
+    """Insert + select + delete on the old connect-per-call path vs. the pool"""
+    insert = "INSERT INTO Visitors (FirstName, LastName, TimeIn, DateIn) VALUES (?, ?, ?, ?)"
+    select = "SELECT TimeIn, DateIn FROM Visitors WHERE FirstName = ? AND LastName = ?"
+    delete = "DELETE FROM Visitors WHERE FirstName = ? AND LastName = ?"
+    with tempfile.TemporaryDirectory() as directory:
+        path = scratchDatabase(directory)
+
+        def legacy(i):
+            _legacySqldata(insert, "Bench", str(i), "01:00:00 AM", "01/01/2024", database=path)
+            _legacySqldata(select, "Bench", str(i), database=path, fetch=1)
+            _legacySqldata(delete, "Bench", str(i), database=path)
+
+        report("sqldata connect-per-call", timeit(legacy, runs) / 3)
+
+        pool = database.Database(path)
+
+        def pooled(i):
+            pool.execute(insert, "Bench", str(i), "01:00:00 AM", "01/01/2024")
+            pool.execute(select, "Bench", str(i), fetch=1)
+            pool.execute(delete, "Bench", str(i))
+
+        report("sqldata pooled (WAL, synchronous=NORMAL)", timeit(pooled, runs) / 3)
+        pool.close()
+
+
+SLIP = b"VISITOR:\nName: Bench Mark\n" + b"\n" * 10 + b"\x1b\x64\x02"
+
+
+def timeBackend(name, backend, runs):
+    old = driver.setBackend(backend)
+    try:
+        report(name, timeit(lambda i: driver.printIfConnected(SLIP), runs))
+    finally:
+        driver.setBackend(old)
+        backend.close()
+
+
+def benchPrinterd(runs=2000):
+    """Slip-sized jobs through printerd into a plain file standing in for the printer"""
+    with tempfile.TemporaryDirectory() as directory:
+        device = os.path.join(directory, "lp0")
+        open(device, "wb").close()
+        server = printerd.PrinterServer(os.path.join(directory, "printerd.sock"), device)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            backend = driver.UsbBackend(device, server.server_address)
+            timeBackend("printerd job round trip", backend, runs)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+def benchBackends(runs=5000):
+    """Slip-sized jobs through each stand-in printer backend"""
+    timeBackend("memory backend", driver.MemoryBackend(), runs)
+    with tempfile.TemporaryDirectory() as directory:
+        device = os.path.join(directory, "lp0")
+        open(device, "wb").close()
+        timeBackend("file backend", driver.FileBackend(device), runs)
+    standIn = driver.StandInPrinter().start()
+    try:
+        host, port = standIn.server_address
+        timeBackend("network backend (local stand-in)", driver.NetworkBackend(host, port), runs)
+    finally:
+        standIn.stop()
+
+
+def _legacyLateSlip(name):
+    # The old printlate, which rebuilt and re-encoded the whole slip every time
+    formatted_text = f"LATE SLIP\nName: {name}\nTime: {printer.get_time()}\nDate: {printer.get_date()}"
+    finaltext = formatted_text.encode("ascii").replace(printer.CF, printer.LF)
+    return finaltext + b"\x0A" + (printer.LF * 10) + b"\x1B\x64\x02"
+
+
+def benchSlips(runs=100000):
+    """Rendering late slips: the old f-string path vs. the compiled template"""
+    names = [f"Student {i}" for i in range(1000)]
+    report("late slip f-string", timeit(lambda i: _legacyLateSlip(names[i % 1000]), runs))
+    report("late slip template", timeit(lambda i: printer.lateSlip(names[i % 1000]), runs))
+
+
+def benchKiosk(runs=2000):
+    """Simulated visitors signing in (slip printed to memory) and back out through core"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = scratchDatabase(directory)
+        migrations.migrate(path)
+        old = driver.setBackend(driver.MemoryBackend())
+        prints = printqueue.PrintQueue()
+        kiosk = core.Kiosk(path, prints)
+        try:
+            report("visitor sign in", timeit(lambda i: kiosk.signInVisitor("Sim", f"Visitor{i}"), runs))
+            report("visitor sign out by name", timeit(lambda i: kiosk.signOutVisitorByName("Sim", f"Visitor{i}"), runs))
+            prints.join()
+        finally:
+            prints.stop()
+            driver.setBackend(old)
+            database.getDatabase(path).close()
+
+
+def benchStudents(runs=2000):
+    """A bell time burst of late students: a commit each vs. the write buffer"""
+    insert = "INSERT INTO StudentEvents (FirstName, LastName, Grade, Type, Epoch) VALUES (?, ?, ?, ?, ?)"
+    with tempfile.TemporaryDirectory() as directory:
+        path = scratchDatabase(directory)
+        migrations.migrate(path)
+        pool = database.getDatabase(path)
+        report(
+            "student event, commit each",
+            timeit(lambda i: pool.execute(insert, "Late", f"Student{i}", 7, "late", i), runs),
+        )
+        writes = pool.buffer(insert)
+
+        def buffered(i):
+            writes.add("Late", f"Student{i}", 7, "late", i)
+            if i == runs - 1:
+                writes.flush()
+
+        report("student event, buffered", timeit(buffered, runs))
+        pool.close()
+
+
+def benchSignOutAll(sizes=(5, 500, 5000)):
+    """Signing everyone out at the end of the day, by how many are signed in"""
+    insert = "INSERT INTO Visitors (FirstName, LastName, TimeIn, DateIn, EpochIn) VALUES (?, ?, ?, ?, ?)"
+    with tempfile.TemporaryDirectory() as directory:
+        path = scratchDatabase(directory)
+        migrations.migrate(path)
+        kiosk = core.Kiosk(path)
+        for size in sizes:
+            with kiosk.db.transaction() as conn:
+                conn.executemany(
+                    insert,
+                    (("Bench", str(i), "08:00:00 AM", "01/01/2024", i) for i in range(size)),
+                )
+            start = time.perf_counter()
+            kiosk.signOutAll()
+            report(f"sign out all, {size} signed in", time.perf_counter() - start)
+        database.getDatabase(path).close()
+
+
+SEARCH_BUDGET_US = 1000
+SEARCH_QUERIES = ["jo sm", "jhon smith", "smyth", "visitor 12", "zz"]
+
+
+def benchNames(runs=2000, visitors=500):
+    """Sign out name searches (typed prefixes, typos) over a full building"""
+    index = nameindex.NameIndex()
+    for i in range(visitors):
+        index.add(i, f"Visitor{i % 97} Family{i}")
+    index.add(visitors, "John Smith")
+    index.add(visitors + 1, "John Smith")
+    best = 0
+    for query in SEARCH_QUERIES:
+        seconds = timeit(lambda i: index.search(query), runs)
+        report(f"name search {query!r}", seconds)
+        best = max(best, seconds)
+    if best * 1e6 > SEARCH_BUDGET_US:
+        print(f"FAIL: slowest search took {best * 1e6:.0f}us, budget is {SEARCH_BUDGET_US}us")
+        return False
+    return True
+
+
+def benchRoster(runs=2000, students=2000):
+    """Typeahead over a school's roster, one keystroke at a time"""
+    index = roster.RosterIndex(
+        (f"First{i % 300}", f"Last{i}", i % 12 + 1) for i in range(students)
+    )
+    typed = [("f", "", 7), ("first1", "", 7), ("fi", "last12", None), ("", "l", None)]
+    slowest = 0
+    for first, last, grade in typed:
+        seconds = timeit(lambda i: index.suggest(first, last, grade), runs)
+        report(f"roster suggest {first!r} {last!r} grade {grade}", seconds)
+        slowest = max(slowest, seconds)
+    if slowest * 1e6 > SEARCH_BUDGET_US:
+        print(f"FAIL: slowest suggestion took {slowest * 1e6:.0f}us, budget is {SEARCH_BUDGET_US}us")
+        return False
+    return True
+
+
+def benchDialogs(runs=50):
+    """Main screen tap to drawn page, the first time (built) and after (cached)"""
+    import main
+    import tk
+    from tkinter import font
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = scratchDatabase(directory)
+        migrations.migrate(path)
+        main.KIOSK = core.Kiosk(path)
+        try:
+            main.setupWindow()
+        except tk.TclError as e:
+            print(f"skipped, no display: {e}")
+            return None
+        pages = {
+            "student sign in": ("studentIn", main.studentSignIn),
+            "student sign out": ("studentOut", main.studentSignOut),
+            "visitor sign in": ("visitorIn", main.visitorinpage),
+            "visitor sign out": ("visitorOut", main.visitoroutpage),
+        }
+        leaked = 0
+        try:
+            for name, (key, show) in pages.items():
+                times = []
+                for i in range(runs + 1):
+                    start = time.perf_counter()
+                    show()
+                    main.window.update()
+                    times.append(time.perf_counter() - start)
+                    main.hidePage(main.PAGES[key][0])
+                    main.window.update()
+                    if i == 0:
+                        fonts = len(font.names(main.window))
+                report(f"{name} page, first", times[0])
+                report(f"{name} page, again", sum(times[1:]) / runs)
+                # Showing a page again shouldn't make any new fonts
+                leaked += len(font.names(main.window)) - fonts
+        finally:
+            main.window.destroy()
+            database.getDatabase(path).close()
+    if leaked:
+        print(f"FAIL: {leaked} fonts were made showing pages again")
+        return False
+    return True
+
+
+STARTUP_BUDGET_MS = 150
+# None of these should load until something actually uses them
+LAZY_MODULES = ["bcrypt", "pymsgbox", "tksheet", "http.client", "server"]
+
+
+def runPython(directory, *args):
+    """Runs a fresh interpreter in directory with this checkout importable,
+    returning the CompletedProcess"""
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    return subprocess.run(
+        [sys.executable, *args], cwd=directory, env=env, capture_output=True, text=True, check=True
+    )
+
+
+def eagerModules(directory):
+    """Which LAZY_MODULES `import main` loaded for real"""
+    check = (
+        "import main, sys, importlib.util;"
+        "print([m for m in %r if m in sys.modules"
+        " and not isinstance(sys.modules[m], importlib.util._LazyModule)])" % LAZY_MODULES
+    )
+    return runPython(directory, "-c", check).stdout.strip()
+
+
+def importTime(directory, runs=5):
+    """The best `import main` time of runs, in seconds, from -X importtime"""
+    times = []
+    for _ in range(runs):
+        stderr = runPython(directory, "-X", "importtime", "-c", "import main").stderr
+        last = stderr.strip().splitlines()[-1]
+        times.append(int(last.split("|")[1]) / 1e6)
+    return min(times)
+
+
+def benchStartup(runs=5):
+    """`import main` cost from -X importtime, failing if it's over budget"""
+    # Somewhere empty, so anything importing main leaves behind is thrown away
+    with tempfile.TemporaryDirectory() as directory:
+        loaded = eagerModules(directory)
+        best = importTime(directory, runs)
+    report("import main (best of %d)" % runs, best)
+    failures = []
+    if best * 1000 > STARTUP_BUDGET_MS:
+        failures.append(f"import main took {best * 1000:.0f}ms, budget is {STARTUP_BUDGET_MS}ms")
+    if loaded != "[]":
+        failures.append(f"imported eagerly: {loaded}")
+    for failure in failures:
+        print("FAIL:", failure)
+    return not failures
+
+
+LOAD_P95_BUDGET_MS = 100
+
+
+def _freePort():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _startServer(path):
+    port = _freePort()
+    process = subprocess.Popen(
+        [sys.executable, "server.py", "--host", "127.0.0.1", "--port", str(port), "--database", path],
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError("server.py didn't start")
+            time.sleep(0.05)
+
+
+def _simulateKiosks(url, directory, kiosks, visits, fresh=False):
+    # Each kiosk signs visitors in, looks one up by name and signs them out by
+    # Id, as scanning their badge would.
+    # Returns every request's latency in seconds and the wall time.
+    latencies = []
+    lock = threading.Lock()
+    start = threading.Barrier(kiosks + 1)
+    # Real kiosks each fsync their own disk. Here they'd all queue on this
+    # machine's one disk, so they share a journal and its group fsync.
+    shared = journal.Journal(os.path.join(directory, "kiosks.journal"))
+
+    def kiosk(number):
+        remote = client.RemoteKiosk(url, journalPath=shared.path)
+        remote.journal.close()
+        remote.journal = shared
+        mine = []
+        visitor = {}
+        start.wait()
+        for i in range(visits):
+            for call in (
+                lambda: visitor.update(id=remote.signInVisitor("Load", f"Kiosk{number} Visitor{i}")),
+                lambda: remote.searchVisitors(f"kiosk{number} visitor{i}", 1),
+                lambda: remote.signOutVisitor(visitor["id"]),
+            ):
+                if fresh:
+                    remote.close()
+                began = time.perf_counter()
+                call()
+                mine.append(time.perf_counter() - began)
+        remote.close()
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=kiosk, args=(n,)) for n in range(kiosks)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - began
+    shared.close()
+    return latencies, wall
+
+
+def benchServer(kiosks=40, visits=25, lates=500):
+    """A load test: dozens of simulated kiosks hammering server.py on localhost"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = scratchDatabase(directory)
+        process, url = _startServer(path)
+        try:
+            remote = client.RemoteKiosk(url, journalPath=os.path.join(directory, "bench.journal"))
+            before = remote.countPastVisitors()
+            failures = []
+            for fresh in (True, False):
+                latencies, wall = _simulateKiosks(url, directory, kiosks, visits, fresh)
+                latencies.sort()
+                label = "new connection each" if fresh else "keep-alive"
+                report(f"{kiosks} kiosks, {label}", sum(latencies) / len(latencies))
+                p95 = latencies[int(len(latencies) * 0.95)]
+                print(f"{'':<8}p95 {p95 * 1000:.1f}ms, {len(latencies) / wall:.0f} requests/s")
+                if not fresh and p95 * 1000 > LOAD_P95_BUDGET_MS:
+                    failures.append(f"keep-alive p95 was {p95 * 1000:.0f}ms, budget is {LOAD_P95_BUDGET_MS}ms")
+            late = ("addStudentEvent", ("Load", "Student", 8, core.STUDENT_LATE), {})
+            report("late student, one request each", timeit(lambda i: remote.call(late[0], *late[1]), lates))
+            report("late student, batches of 50", timeit(lambda i: remote.batch([late] * 50), lates // 50) / 50)
+            signedIn = len(remote.currentVisitors())
+            moved = remote.countPastVisitors() - before
+            if signedIn or moved != 2 * kiosks * visits:
+                failures.append(f"{signedIn} still signed in and {moved} signed out, expected 0 and {2 * kiosks * visits}")
+            remote.close()
+        finally:
+            process.terminate()
+            process.wait()
+    for failure in failures:
+        print("FAIL:", failure)
+    return not failures
+
+
+BENCHMARKS = {
+    "sqldata": benchSqldata,
+    "printerd": benchPrinterd,
+    "backends": benchBackends,
+    "slips": benchSlips,
+    "startup": benchStartup,
+    "kiosk": benchKiosk,
+    "names": benchNames,
+    "students": benchStudents,
+    "roster": benchRoster,
+    "dialogs": benchDialogs,
+    "signoutall": benchSignOutAll,
+    "server": benchServer,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    passed = True
+    for name in names:
+        print(f"== {name}")
+        # Benchmarks with a budget return False when they go over it
+        if BENCHMARKS[name]() is False:
+            passed = False
+    exit(0 if passed else 1)
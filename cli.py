@@ -0,0 +1,331 @@
+#!/bin/env python3
+"""Command line front end for the kiosk, for scripts and display-less boxes.
+
+    python cli.py signin Jane Doe
+    python cli.py signout Jane Doe
+    python cli.py find jane do         (closest names first, with visit ids)
+    python cli.py current
+    python cli.py export past --month 09/2024 -o september.csv.gz
+    python cli.py analytics --month 09/2024
+    python cli.py batch commands.txt   (one command per line, "-" for stdin)
+
+Nothing is printed on paper unless --printer is given (a PRINTER_BACKEND
+spec like "usb" or "file:/tmp/slips")."""
+import argparse
+import datetime
+import getpass
+import logging
+import shlex
+import sqlite3
+import sys
+
+import core
+import database
+import driver
+import export
+import migrations
+import printqueue
+
+
+def signin(kiosk: core.Kiosk, args):
+    visitorId = kiosk.signInVisitor(args.first, args.last)
+    print(
+        f"Signed in {core.normalizeName(args.first)} {core.normalizeName(args.last)}"
+        f" (visit {visitorId})"
+    )
+
+
+def signout(kiosk: core.Kiosk, args):
+    if args.id is not None:
+        signedOut = kiosk.signOutVisitor(args.id)
+    elif args.badge is not None:
+        signedOut = kiosk.signOutBadge(args.badge)
+    else:
+        signedOut = kiosk.signOutVisitorByName(args.first, args.last)
+    if signedOut is None:
+        print("Visitor not found")
+        return 1
+    print(f"Signed out {signedOut[0]} {signedOut[1]}")
+
+
+def find(kiosk: core.Kiosk, args):
+    for row in kiosk.searchVisitors(" ".join(args.name), args.limit):
+        print("\t".join(str(column) for column in row))
+
+
+def late(kiosk: core.Kiosk, args):
+    kiosk.studentLate(args.first, args.last, args.grade)
+    print(f"Late slip for {core.normalizeName(args.first)} {core.normalizeName(args.last)}")
+
+
+def dayBounds(date: str):
+    """Epochs for the start of an mm/dd/yyyy day and of the day after"""
+    try:
+        day = datetime.datetime.strptime(date, "%m/%d/%Y")
+    except ValueError:
+        raise core.ValidationError(f"{date!r} is not a mm/dd/yyyy date") from None
+    return int(day.timestamp()), int((day + datetime.timedelta(days=1)).timestamp())
+
+
+def monthBounds(month: str):
+    """Epochs for the start of an mm/yyyy month and of the month after"""
+    try:
+        start = datetime.datetime.strptime(month, "%m/%Y")
+    except ValueError:
+        raise core.ValidationError(f"{month!r} is not a mm/yyyy month") from None
+    end = start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    return int(start.timestamp()), int(end.timestamp())
+
+
+def rangeBounds(args):
+    """Epoch bounds from --month, --from and --to, None where they're left out"""
+    start = end = None
+    if args.month:
+        start, end = monthBounds(args.month)
+    if args.start:
+        start = dayBounds(args.start)[0]
+    if args.end:
+        end = dayBounds(args.end)[1]
+    return start, end
+
+
+def addRangeArguments(command):
+    command.add_argument("--from", dest="start", help="first day, mm/dd/yyyy")
+    command.add_argument("--to", dest="end", help="last day, mm/dd/yyyy")
+    command.add_argument("--month", help="just this month, mm/yyyy")
+
+
+def exportVisits(kiosk: core.Kiosk, args):
+    start, end = rangeBounds(args)
+    try:
+        count = export.export(
+            kiosk,
+            args.table,
+            args.output,
+            args.format,
+            args.gzip or None,
+            name=args.name,
+            start=start,
+            end=end,
+        )
+    except BrokenPipeError:
+        # Piped into head or similar, which stopped reading
+        sys.stdout = None
+        return 0
+    print(f"Exported {count} visits", file=sys.stderr if args.output == "-" else sys.stdout)
+
+
+def students(kiosk: core.Kiosk, args):
+    start = end = None
+    if args.date:
+        start, end = dayBounds(args.date)
+    for fname, lname, grade, kind, epoch in kiosk.studentEvents(
+        args.grade, start, end, args.type
+    ):
+        when = datetime.datetime.fromtimestamp(epoch).strftime("%m/%d/%Y %I:%M:%S %p")
+        print(f"{fname}\t{lname}\t{grade}\t{kind}\t{when}")
+
+
+def current(kiosk: core.Kiosk, args):
+    for row in kiosk.currentVisitors():
+        print("\t".join(str(column) for column in row))
+
+
+def past(kiosk: core.Kiosk, args):
+    for row in kiosk.pastVisitors():
+        print("\t".join(str(column) for column in row))
+
+
+def clearPast(kiosk: core.Kiosk, args):
+    kiosk.clearPast()
+
+
+def signoutAll(kiosk: core.Kiosk, args):
+    print(f"Signed out {kiosk.signOutAll()} visitors")
+
+
+def addAdmin(kiosk: core.Kiosk, args):
+    kiosk.loadAdmins()
+    if args.username.lower() in kiosk.admins:
+        print("That username is taken")
+        return 1
+    password = getpass.getpass("Password: ")
+    if password != getpass.getpass("Confirm password: "):
+        print("Passwords do not match")
+        return 1
+    kiosk.addAdmin(args.username, password, args.name)
+
+
+def importRoster(kiosk: core.Kiosk, args):
+    with open(args.file, newline="", encoding="utf-8-sig") as rosterFile:
+        try:
+            count = kiosk.importRoster(rosterFile)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 1
+    print(f"Imported {count} students")
+
+
+def showAnalytics(kiosk: core.Kiosk, args):
+    if args.rebuild:
+        kiosk.rebuildAnalytics()
+    start, end = rangeBounds(args)
+    print("Day\tSigned in\tSigned out\tAverage minutes")
+    for row in kiosk.dailyVisits(start, end):
+        print("\t".join(str(column) for column in row))
+    print("\nHour\tSigned in\tSigned out")
+    for hour, signIns, signOuts in kiosk.hourlyVisits(start, end):
+        print(f"{hour:02}:00\t{signIns}\t{signOuts}")
+    print("\nGrade\tLate\tLeft early")
+    for row in kiosk.studentsByGrade(start, end):
+        print("\t".join(str(column) for column in row))
+
+
+def archiveHistory(kiosk: core.Kiosk, args):
+    print(f"Archived {kiosk.archiveHistory(args.days)} visits")
+
+
+def batch(kiosk: core.Kiosk, args):
+    source = sys.stdin if args.file == "-" else open(args.file)
+    failures = 0
+    with source:
+        for number, line in enumerate(source, start=1):
+            words = shlex.split(line, comments=True)
+            if not words:
+                continue
+            try:
+                commandArgs = PARSER.parse_args(words)
+            except SystemExit:
+                print(f"line {number}: can't parse {line.strip()!r}", file=sys.stderr)
+                failures += 1
+                continue
+            if commandArgs.func is batch:
+                print(f"line {number}: batches can't nest", file=sys.stderr)
+                failures += 1
+                continue
+            if run(kiosk, commandArgs):
+                failures += 1
+    return 1 if failures else 0
+
+
+def run(kiosk: core.Kiosk, args):
+    try:
+        return args.func(kiosk, args) or 0
+    except core.ValidationError as e:
+        print(e, file=sys.stderr)
+    except sqlite3.Error as e:
+        logging.error("Database error: %s", e)
+        print(f"Database error: {e}", file=sys.stderr)
+    return 1
+
+
+def makeParser():
+    parser = argparse.ArgumentParser(description="Kiosk command line")
+    parser.add_argument("--database", default="data.db")
+    parser.add_argument("--printer", help="printer backend spec; slips aren't printed without one")
+    commands = parser.add_subparsers(required=True)
+
+    command = commands.add_parser("signin", help="sign a visitor in")
+    command.add_argument("first")
+    command.add_argument("last")
+    command.set_defaults(func=signin)
+
+    command = commands.add_parser(
+        "signout", help="sign a visitor out by name, visit id or badge"
+    )
+    command.add_argument("first", nargs="?", default="")
+    command.add_argument("last", nargs="?", default="")
+    command.add_argument("--id", type=int)
+    command.add_argument("--badge", help="the token under the barcode on their slip")
+    command.set_defaults(func=signout)
+
+    command = commands.add_parser("find", help="find signed in visitors by a rough name")
+    command.add_argument("name", nargs="+")
+    command.add_argument("--limit", type=int, default=10)
+    command.set_defaults(func=find)
+
+    command = commands.add_parser("late", help="print a student's late slip")
+    command.add_argument("first")
+    command.add_argument("last")
+    command.add_argument("grade", type=int)
+    command.set_defaults(func=late)
+
+    command = commands.add_parser("students", help="list late and early students")
+    command.add_argument("--grade", type=int)
+    command.add_argument("--date", help="just this day, mm/dd/yyyy")
+    command.add_argument("--type", choices=[core.STUDENT_LATE, core.STUDENT_EARLY])
+    command.set_defaults(func=students)
+
+    command = commands.add_parser("current", help="list current visitors")
+    command.set_defaults(func=current)
+
+    command = commands.add_parser("past", help="list past visitors")
+    command.set_defaults(func=past)
+
+    command = commands.add_parser("clear-past", help="delete all visit history")
+    command.set_defaults(func=clearPast)
+
+    command = commands.add_parser(
+        "signout-all", help="sign out every visitor, keeping their visits in history"
+    )
+    command.set_defaults(func=signoutAll)
+
+    command = commands.add_parser("add-admin", help="add an admin (asks for the password)")
+    command.add_argument("username")
+    command.add_argument("name")
+    command.set_defaults(func=addAdmin)
+
+    command = commands.add_parser("import-roster", help="add or update students from a CSV file")
+    command.add_argument("file")
+    command.set_defaults(func=importRoster)
+
+    command = commands.add_parser("export", help="write visits out as CSV or JSON Lines")
+    command.add_argument("table", choices=list(export.TABLES))
+    command.add_argument("-o", "--output", default="-", help="file to write, - for stdout")
+    command.add_argument("--format", choices=export.FORMATS, help="default from the file name")
+    command.add_argument("--gzip", action="store_true", help="default from a .gz file name")
+    command.add_argument("--name", default="", help="first or last name starts with")
+    addRangeArguments(command)
+    command.set_defaults(func=exportVisits)
+
+    command = commands.add_parser("analytics", help="visit and late slip counts by day, hour and grade")
+    addRangeArguments(command)
+    command.add_argument("--rebuild", action="store_true", help="recompute the counts from all history first")
+    command.set_defaults(func=showAnalytics)
+
+    command = commands.add_parser("archive", help="move old visit history to the term archives")
+    command.add_argument("--days", type=int, help="keep this many days in data.db")
+    command.set_defaults(func=archiveHistory)
+
+    command = commands.add_parser("batch", help="run commands from a file, one per line")
+    command.add_argument("file")
+    command.set_defaults(func=batch)
+    return parser
+
+
+PARSER = makeParser()
+
+
+def main(argv=None):
+    args = PARSER.parse_args(argv)
+    migrations.migrate(args.database)
+    prints = None
+    if args.printer:
+        driver.setBackend(driver.makeBackend(args.printer))
+        prints = printqueue.PrintQueue()
+    kiosk = core.Kiosk(args.database, prints)
+    try:
+        kiosk.recover()
+    except sqlite3.Error as e:
+        logging.error("Replaying the journal failed: %s", e)
+    kiosk.loadRoster()
+    status = run(kiosk, args)
+    if prints is not None:
+        prints.join()
+    # Writes out any buffered student events
+    database.closeAll()
+    return status
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,249 @@
+"""A kiosk that works through server.py instead of its own data.db.
+
+RemoteKiosk has the same methods main.py uses on core.Kiosk, so a kiosk at a
+second entrance shares visitors with the first by setting
+KIOSK_SERVER=http://host:port. Slips still print on the kiosk's own printer.
+
+Each thread keeps one keep-alive connection to the server. Failures come back
+as RemoteError, a sqlite3.Error, so anything that copes with the database
+being unavailable copes with the server being unavailable too.
+
+Sign ins and outs go in the kiosk's own remote.journal before they're sent,
+under a Key the server remembers, so one the server never got is sent again by
+recover() and one sent twice only counts once."""
+import functools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+
+import badge
+import core
+import journal
+import lazy
+import printer
+import roster
+
+# Only kiosks that use a server need these
+http = lazy.lazyImport("http.client")
+server = lazy.lazyImport("server")
+urlparse = lazy.lazyImport("urllib.parse")
+
+TIMEOUT = 10.0
+JOURNAL = "remote.journal"
+# Calls that would happen twice if the server ran one but the reply was lost.
+# Everything else only reads, or is a journal record the server applies once.
+NO_RETRY = {"addStudentEvent"}
+
+
+class RemoteError(sqlite3.Error):
+    pass
+
+
+def serverUrl():
+    """The KIOSK_SERVER to use, or None to use data.db directly"""
+    return os.environ.get("KIOSK_SERVER") or None
+
+
+class RemoteKiosk:
+    def __init__(self, url: str, prints=None, key=None, timeout=TIMEOUT, journalPath=JOURNAL):
+        parts = urlparse.urlsplit(url)
+        self.url = url
+        self.host = parts.hostname
+        self.port = parts.port or server.DEFAULT_PORT
+        self.prints = prints
+        self.timeout = timeout
+        self.headers = {"Content-Type": "application/json"}
+        key = os.environ.get("KIOSK_SERVER_KEY", "") if key is None else key
+        if key:
+            self.headers[server.KEY_HEADER] = key
+        self.admins = {}
+        # A copy of the roster, so suggestions don't wait on the network
+        self.roster = roster.RosterIndex()
+        self._local = threading.local()
+        self.journal = journal.Journal(journalPath)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.HTTPConnection(
+                self.host, self.port, timeout=self.timeout
+            )
+        return conn
+
+    def _post(self, path: str, payload, retry=True):
+        body = json.dumps(payload, separators=(",", ":")).encode()
+        for attempt in (1, 2):
+            conn = self._connection()
+            reused = conn.sock is not None
+            try:
+                conn.request("POST", path, body, self.headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (http.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as e:
+                conn.close()
+                # The server most likely dropped an idle connection before reading
+                # this, so try a fresh one, unless running it twice would matter
+                if retry and reused and attempt == 1:
+                    continue
+                raise RemoteError(f"Kiosk server {self.url} failed: {e}") from e
+            except (OSError, http.HTTPException) as e:
+                conn.close()
+                raise RemoteError(f"Kiosk server {self.url} failed: {e}") from e
+            if response.status != 200:
+                raise RemoteError(f"Kiosk server {self.url} said {response.status}: {data[:200]!r}")
+            return json.loads(data)
+
+    @staticmethod
+    def _result(reply):
+        if "error" not in reply:
+            return reply["result"]
+        if reply["type"] == "ValidationError":
+            return core.ValidationError(reply["error"])
+        return RemoteError(reply["error"])
+
+    def call(self, method: str, *args, **kwargs):
+        """Runs a Kiosk method on the server and returns what it returned"""
+        result = self._result(
+            self._post("/call", {"method": method, "args": args, "kwargs": kwargs}, method not in NO_RETRY)
+        )
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def batch(self, calls):
+        """Runs (method, args, kwargs) calls on the server in one request, in
+        order. Returns their results, with the exception in place of any that
+        failed; a failed call doesn't stop the ones after it."""
+        calls = [{"method": method, "args": args, "kwargs": kwargs} for method, args, kwargs in calls]
+        replies = self._post("/batch", calls, not any(call["method"] in NO_RETRY for call in calls))
+        return [self._result(reply) for reply in replies]
+
+    def __getattr__(self, name):
+        if name not in server.METHODS:
+            raise AttributeError(name)
+        return functools.partial(self.call, name)
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # What a kiosk does itself rather than on the server
+
+    def printSlip(self, slip: bytes, callback=None):
+        if self.prints is None:
+            return None
+        return self.prints.submit(slip, callback)
+
+    def _submit(self, record: dict):
+        # Journaled here first, like Kiosk._journal, then applied on the server
+        record = dict(record, Key=uuid.uuid4().hex)
+        try:
+            self.journal.append(record)
+        except OSError as e:
+            logging.critical("Journal write failed, going straight to the server: %s", e)
+        return self.call("submitRecord", record)
+
+    def signInVisitor(self, fname: str, lname: str, printCallback=None):
+        """Like Kiosk.signInVisitor: if the server can't be reached the visit
+        stays in the journal, the slip prints without a barcode and this
+        returns None"""
+        record = core.signInRecord(fname, lname)
+        name = f"{record['FirstName']} {record['LastName']}"
+        try:
+            visitorId = self._submit(record)
+        except RemoteError as e:
+            logging.error("Visitor %s is only in the journal for now: %s", name, e)
+            visitorId = None
+        token = None if visitorId is None else badge.makeToken(visitorId, record["Token"])
+        self.printSlip(printer.visitorSlip(name, token), printCallback)
+        return visitorId
+
+    def signOutVisitor(self, visitorId: int, secret=None):
+        signedOut = self._submit(core.signOutRecord(visitorId, secret))
+        return None if signedOut is None else tuple(signedOut)
+
+    def signOutBadge(self, token: str):
+        try:
+            visitorId, secret = badge.parseToken(token)
+        except ValueError as e:
+            raise core.ValidationError(str(e)) from None
+        return self.signOutVisitor(visitorId, secret)
+
+    def signOutVisitorByName(self, fname: str, lname: str):
+        visitorId = self.call("findVisitor", fname, lname)
+        if visitorId is None:
+            return None
+        return self.signOutVisitor(visitorId)
+
+    def signOutAll(self):
+        return self._submit(core.signOutAllRecord())
+
+    def studentLate(self, fname: str, lname: str, grade: int, printCallback=None):
+        name = f"{core.normalizeName(fname)} {core.normalizeName(lname)}"
+        try:
+            self.call("addStudentEvent", fname, lname, grade, core.STUDENT_LATE)
+        except RemoteError:
+            # They still need the slip to get into class
+            self.printSlip(printer.lateSlip(name), printCallback)
+            raise
+        return self.printSlip(printer.lateSlip(name), printCallback)
+
+    def studentEarly(self, fname: str, lname: str, grade: int):
+        self.call("addStudentEvent", fname, lname, grade, core.STUDENT_EARLY)
+
+    def iterPastVisitors(self, name="", start=None, end=None):
+        """Yields past visits like Kiosk.iterPastVisitors, a page of
+        core.EXPORT_BATCH at a time from the server"""
+        key = None
+        while True:
+            rows, key = self.call(
+                "pastVisitorsPage", key, core.EXPORT_BATCH, "EpochIn", False, name, start, end, epochs=True
+            )
+            yield from rows
+            if key is None:
+                return
+
+    def loadRoster(self):
+        self.roster.load(self.call("rosterStudents"))
+        return self.roster
+
+    def importRoster(self, lines):
+        count = self.call("importRoster", list(lines))
+        self.loadRoster()
+        return count
+
+    def suggestStudents(self, fname: str, lname: str, grade=None, limit=8):
+        return self.roster.suggest(fname, lname, grade or None, limit)
+
+    def loadAdmins(self):
+        # Just the names, so the kiosk knows who can log in; the server checks passwords
+        core.replaceAdmins(self.admins, dict.fromkeys(self.call("adminNames")))
+        return self.admins
+
+    def addAdmin(self, username: str, password: str, name: str):
+        raise core.ValidationError("Admins can only be added on the server computer, with cli.py")
+
+    def clearPast(self):
+        raise core.ValidationError("The past can only be cleared on the server computer, with cli.py")
+
+    def recover(self):
+        """Sends the server every journaled sign in and out it may have
+        missed, then empties the journal. The server replays its own."""
+
+        def submit(record):
+            try:
+                self.call("submitRecord", record)
+            except core.ValidationError as e:
+                # It will never go through, so it mustn't hold up the rest
+                logging.critical("Server refused journal record %s, dropping it: %s", record, e)
+
+        return self.journal.replay(submit)
+
+    def archiveHistory(self, days=None):
+        # and archives its own history
+        return 0
@@ -0,0 +1,646 @@
+"""The kiosk's sign-in/out, history, admin and printing logic, with no UI.
+
+main.py is the Tk front end over this and cli.py is the command line one.
+Errors come back as exceptions (ValidationError for bad input, sqlite3.Error
+for the database) for the front end to show however it likes."""
+import datetime
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+
+import analytics
+import archive
+import auth
+import badge
+import database
+import journal
+import nameindex
+import printer
+import roster
+
+
+PAGE_SIZE = 200
+# Rows fetched from the cursor at a time when streaming an export
+EXPORT_BATCH = 500
+# Columns the past visitor list can be sorted by, by their on-screen names
+PAST_SORTS = {
+    "Time In": "EpochIn",
+    "Time Out": "EpochOut",
+    "First Name": "FirstName",
+    "Last Name": "LastName",
+}
+# How long to remember applied journal records, in seconds
+KEEP_APPLIED = 24 * 60 * 60
+STUDENT_LATE = "late"
+STUDENT_EARLY = "early"
+
+
+class ValidationError(ValueError):
+    pass
+
+
+def getReadableTime():
+    """Gets the current time in a human-readable format"""
+    return datetime.datetime.now().strftime("%I:%M:%S %p")
+
+
+def getReadableDate():
+    return datetime.datetime.now().strftime("%m/%d/%Y")
+
+
+def getEpoch():
+    return int(time.time())
+
+
+def normalizeName(name: str):
+    return name.strip().capitalize()
+
+
+def checkName(fname: str, lname: str):
+    if not (fname and lname):
+        raise ValidationError("You must enter both firstname and lastname")
+
+
+def replaceAdmins(admins: dict, fresh: dict):
+    """Makes admins hold just what fresh does, without ever emptying it, since
+    other threads read it meanwhile"""
+    for username in admins.keys() - fresh.keys():
+        admins.pop(username, None)
+    admins.update(fresh)
+
+
+# Journal records, built where the sign in or out happens so a kiosk using
+# server.py can journal them itself (see Kiosk.submitRecord)
+
+
+def signInRecord(fname: str, lname: str):
+    """A record that signs a visitor in, with a new secret for their badge"""
+    fname, lname = normalizeName(fname), normalizeName(lname)
+    checkName(fname, lname)
+    return {
+        "Op": "signin",
+        "FirstName": fname,
+        "LastName": lname,
+        "TimeIn": getReadableTime(),
+        "DateIn": getReadableDate(),
+        "EpochIn": getEpoch(),
+        "Token": badge.newSecret(),
+    }
+
+
+def signOutRecord(visitorId: int, secret=None):
+    return {
+        "Op": "signout",
+        "Id": visitorId,
+        "Secret": secret,
+        "TimeOut": getReadableTime(),
+        "DateOut": getReadableDate(),
+        "EpochOut": getEpoch(),
+    }
+
+
+def signOutAllRecord():
+    return {
+        "Op": "signoutall",
+        "TimeOut": getReadableTime(),
+        "DateOut": getReadableDate(),
+        "EpochOut": getEpoch(),
+    }
+
+
+class VisitorWatcher:
+    """Keeps a copy of the current visitors in step with the database.
+
+    poll() is cheap when nothing has changed (one PRAGMA). When something has,
+    it returns what changed since the last poll as (removedIds, addedRows) so
+    a view can update just those rows."""
+
+    def __init__(self, kiosk):
+        self.kiosk = kiosk
+        self.version = None
+        self.rows = {}
+
+    def poll(self):
+        version = self.kiosk.dataVersion()
+        if version == self.version:
+            return None
+        fresh = {row[0]: row for row in self.kiosk.currentVisitors()}
+        # Read the version first, so a commit during the query shows up next poll
+        self.version = version
+        removed = [visitorId for visitorId in self.rows if visitorId not in fresh]
+        added = [row for visitorId, row in fresh.items() if visitorId not in self.rows]
+        self.rows = fresh
+        if not (removed or added):
+            return None
+        return removed, added
+
+
+class Kiosk:
+    """One kiosk's view of the database and printer.
+
+    Slips go to `prints` (a printqueue.PrintQueue) with the callback the
+    caller passes in. Without a print queue nothing is printed, which is what
+    batch jobs and benchmarks want."""
+
+    def __init__(self, path="data.db", prints=None):
+        self.path = path
+        self.db = database.getDatabase(path)
+        self.prints = prints
+        self.admins = {}
+        self.journal = journal.Journal(journal.journalPath(path))
+        # Bell time brings bursts of students, so their events share commits
+        self.studentEventLog = self.db.buffer(
+            "INSERT INTO StudentEvents (FirstName, LastName, Grade, Type, Epoch) VALUES (?, ?, ?, ?, ?)"
+        )
+        self.names = nameindex.NameIndex()
+        self.roster = roster.RosterIndex()
+        self._namesWatcher = VisitorWatcher(self)
+        # server.py searches from many threads; the index is updated by whoever polls
+        self._namesLock = threading.Lock()
+
+    def printSlip(self, slip: bytes, callback=None):
+        if self.prints is None:
+            return None
+        return self.prints.submit(slip, callback)
+
+    # Visitors
+
+    def dataVersion(self):
+        """Changes whenever anything else writes to the database"""
+        return self.db.dataVersion()
+
+    def signInVisitor(self, fname: str, lname: str, printCallback=None):
+        """Adds a visitor and prints their slip, with a badge barcode they can
+        scan to sign out. Returns the new visit's Id, or None if it's only in
+        the journal for now (see addVisitor)."""
+        visitorId, token = self.addVisitor(fname, lname)
+        name = f"{normalizeName(fname)} {normalizeName(lname)}"
+        self.printSlip(printer.visitorSlip(name, token), printCallback)
+        return visitorId
+
+    def addVisitor(self, fname: str, lname: str):
+        """Adds a visitor without printing anything. Returns (visitorId, badge
+        token) for their slip.
+
+        The visit goes in the journal first. If the database then fails, both
+        are None and the slip goes without a barcode; recover() adds the visit
+        once the database is back."""
+        record = self._journal(signInRecord(fname, lname))
+        logging.debug("Adding visitor %s %s", record["FirstName"], record["LastName"])
+        try:
+            visitorId = self.applyRecord(record)
+        except sqlite3.Error as e:
+            # It's in the journal, so recover() will add it later
+            logging.error(
+                "Visitor %s %s is only in the journal for now: %s", record["FirstName"], record["LastName"], e
+            )
+            visitorId = None
+        token = None if visitorId is None else badge.makeToken(visitorId, record["Token"])
+        return visitorId, token
+
+    def findVisitor(self, fname: str, lname: str):
+        """Returns the Id of the earliest open visit for a name, or None"""
+        row = self.db.execute(
+            """SELECT Id FROM Visitors WHERE FirstName = ? AND LastName = ? ORDER BY Id LIMIT 1""",
+            normalizeName(fname),
+            normalizeName(lname),
+            fetch=1,
+        )
+        return row[0] if row else None
+
+    def findVisitors(self, fname: str, lname: str):
+        """Ids of every open visit for a name, earliest first"""
+        return [
+            row[0]
+            for row in self.db.execute(
+                """SELECT Id FROM Visitors WHERE FirstName = ? AND LastName = ? ORDER BY Id""",
+                normalizeName(fname),
+                normalizeName(lname),
+                fetch=2,
+            )
+        ]
+
+    def searchVisitors(self, query: str, limit=10):
+        """Signed in visitors whose names are most like query, best first.
+
+        Rows are (Id, FirstName, LastName, TimeIn, DateIn) like currentVisitors,
+        so two visitors with the same name can be told apart by time in."""
+        with self._namesLock:
+            changes = self._namesWatcher.poll()
+            if changes is not None:
+                removed, added = changes
+                for visitorId in removed:
+                    self.names.remove(visitorId)
+                for row in added:
+                    self.names.add(row[0], f"{row[1]} {row[2]}")
+            rows = self._namesWatcher.rows
+            return [rows[visitorId] for visitorId in self.names.search(query, limit)]
+
+    def signOutVisitor(self, visitorId: int, secret=None):
+        """Moves one visit from Visitors to PastVisitors in a single transaction.
+
+        With a secret, the visit's badge token has to match too. Returns the
+        (FirstName, LastName) that was signed out, or None if the Id was not
+        signed in. The sign out is journaled first, so if the database raises
+        it still happens when recover() next runs."""
+        logging.debug("Signing out visitor %s", visitorId)
+        record = self._journal(signOutRecord(visitorId, secret))
+        return self.applyRecord(record)
+
+    def signOutBadge(self, token: str):
+        """Signs out the visit a scanned badge belongs to, by primary key.
+
+        Raises ValidationError if token isn't a badge. Returns what
+        signOutVisitor does."""
+        try:
+            visitorId, secret = badge.parseToken(token)
+        except ValueError as e:
+            raise ValidationError(str(e)) from None
+        return self.signOutVisitor(visitorId, secret)
+
+    def signOutVisitorByName(self, fname: str, lname: str):
+        visitorId = self.findVisitor(fname, lname)
+        if visitorId is None:
+            return None
+        return self.signOutVisitor(visitorId)
+
+    def currentVisitors(self):
+        """(Id, FirstName, LastName, TimeIn, DateIn) for everyone signed in"""
+        return self.db.execute(
+            "SELECT Id, FirstName, LastName, TimeIn, DateIn FROM Visitors ORDER BY EpochIn",
+            fetch=2,
+        )
+
+    def _history(self, start=None, end=None):
+        """Yields (conn, names, main) for each batch of the archives for
+        [start, end), attached to conn under names, for archive.union().
+        main is True for the last batch only, which searches data.db too.
+
+        Batches come oldest terms first, so queries that sort by time in can
+        run batch after batch."""
+        batches = archive.batches(archive.archives(self.path, start, end))
+        with self.db.connection() as conn:
+            for number, files in enumerate(batches, start=1):
+                with archive.attached(conn, files) as names:
+                    yield conn, names, number == len(batches)
+
+    def pastVisitors(self):
+        """Every past visit, archived ones included, newest first"""
+        rows = []
+        for conn, names, main in self._history():
+            sql, params = archive.union(
+                "FirstName, LastName, TimeIn, DateIn, TimeOut, DateOut, EpochIn", [], [], names, main
+            )
+            rows += conn.execute(f"{sql} ORDER BY EpochIn DESC", params).fetchall()
+        rows.sort(key=lambda row: (row[-1] is not None, row[-1]), reverse=True)
+        return [row[:-1] for row in rows]
+
+    def _pastFilter(self, name="", start=None, end=None):
+        clauses, params = [], []
+        if name:
+            clauses.append("(FirstName LIKE ? OR LastName LIKE ?)")
+            params += [f"{name}%", f"{name}%"]
+        if start is not None:
+            clauses.append("EpochIn >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("EpochIn < ?")
+            params.append(end)
+        return clauses, params
+
+    def countPastVisitors(self, name="", start=None, end=None):
+        clauses, params = self._pastFilter(name, start, end)
+        total = 0
+        for conn, names, main in self._history(start, end):
+            sql, batchParams = archive.union("COUNT(*) AS Visits", clauses, params, names, main)
+            total += conn.execute(f"SELECT SUM(Visits) FROM ({sql})", batchParams).fetchone()[0] or 0
+        return total
+
+    def pastVisitorsPage(
+        self,
+        after=None,
+        limit=PAGE_SIZE,
+        sort="EpochIn",
+        descending=True,
+        name="",
+        start=None,
+        end=None,
+        epochs=False,
+    ):
+        """One page of past visits, sorted and filtered in SQL.
+
+        Pages are found by keyset rather than OFFSET, so every page costs the
+        same however deep into the history it is. Returns (rows, key); pass key
+        back as `after` for the next page. key is None on the last page.
+        name matches the start of a first or last name, and start/end are
+        epoch bounds on the time signed in. Archived terms in that range are
+        searched too. With epochs, rows end with EpochIn and EpochOut like
+        iterPastVisitors's."""
+        if sort not in PAST_SORTS.values():
+            raise ValueError(f"Can't sort past visitors by {sort!r}")
+        clauses, params = self._pastFilter(name, start, end)
+        if after is not None:
+            # SQLite sorts NULL first, and a NULL never compares as before or after
+            value, lastId = after
+            if value is None:
+                clauses.append(
+                    f"({sort} IS NULL AND Id < ?)" if descending else f"({sort} IS NOT NULL OR Id > ?)"
+                )
+                params.append(lastId)
+            else:
+                clauses.append(
+                    f"(({sort}, Id) < (?, ?) OR {sort} IS NULL)" if descending else f"({sort}, Id) > (?, ?)"
+                )
+                params += [value, lastId]
+        order = "DESC" if descending else "ASC"
+        columns = "FirstName, LastName, TimeIn, DateIn, TimeOut, DateOut"
+        if epochs:
+            columns += ", EpochIn, EpochOut"
+        rows = []
+        # Each batch's first page, merged; the page is the first `limit` of those
+        for conn, names, main in self._history(start, end):
+            sql, batchParams = archive.union(
+                f"{columns}, {sort}, Id",
+                clauses,
+                params,
+                names,
+                main,
+            )
+            rows += conn.execute(
+                f"{sql} ORDER BY {sort} {order}, Id {order} LIMIT ?", [*batchParams, limit]
+            ).fetchall()
+        # SQLite sorts NULL before everything else
+        rows.sort(key=lambda row: (row[-2] is not None, row[-2], row[-1]), reverse=descending)
+        rows = rows[:limit]
+        key = tuple(rows[-1][-2:]) if len(rows) == limit else None
+        return [row[:-2] for row in rows], key
+
+    def iterPastVisitors(self, name="", start=None, end=None):
+        """Yields past visits as (FirstName, LastName, TimeIn, DateIn, TimeOut,
+        DateOut, EpochIn, EpochOut), oldest first, archives included.
+
+        Rows come off the cursor a batch at a time rather than all at once,
+        so memory use doesn't grow with the history. Holds a pooled
+        connection until the generator is finished or closed."""
+        clauses, params = self._pastFilter(name, start, end)
+        for conn, names, main in self._history(start, end):
+            sql, batchParams = archive.union(
+                "FirstName, LastName, TimeIn, DateIn, TimeOut, DateOut, EpochIn, EpochOut, Id",
+                clauses,
+                params,
+                names,
+                main,
+            )
+            cursor = conn.execute(f"{sql} ORDER BY EpochIn, Id", batchParams)
+            try:
+                while rows := cursor.fetchmany(EXPORT_BATCH):
+                    for row in rows:
+                        yield row[:-1]
+            finally:
+                cursor.close()
+
+    def iterCurrentVisitors(self, name="", start=None, end=None):
+        """Yields (Id, FirstName, LastName, TimeIn, DateIn, EpochIn) for open
+        visits, oldest first, the same way as iterPastVisitors"""
+        clauses, params = self._pastFilter(name, start, end)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self.db.connection() as conn:
+            cursor = conn.execute(
+                f"SELECT Id, FirstName, LastName, TimeIn, DateIn, EpochIn FROM Visitors {where} ORDER BY EpochIn, Id",
+                params,
+            )
+            try:
+                while rows := cursor.fetchmany(EXPORT_BATCH):
+                    yield from rows
+            finally:
+                cursor.close()
+
+    def archiveHistory(self, days=None):
+        """Moves visits older than days (the RetentionDays setting by default)
+        out to the per-term archives. Returns how many were moved."""
+        return archive.archiveOld(self.path, days)
+
+    def clearPast(self):
+        logging.warning("Past was cleared")
+        self.db.execute("DELETE FROM PastVisitors")
+
+    def signOutAll(self):
+        """Moves every open visit to PastVisitors with the same time out.
+
+        It's two statements in one transaction however many are signed in, and
+        it's journaled like a single sign out. Returns how many were signed out."""
+        logging.warning("All were signed out")
+        record = self._journal(signOutAllRecord())
+        return self.applyRecord(record)
+
+    # Journal
+
+    def _journal(self, record: dict):
+        # Keyed here, so a record the journal writes after all is only applied once
+        record = dict(record, Key=record.get("Key") or uuid.uuid4().hex)
+        try:
+            return self.journal.append(record)
+        except OSError as e:
+            # Still better to get it into the database than to drop it
+            logging.critical("Journal write failed, going straight to the database: %s", e)
+            return record
+
+    def submitRecord(self, record: dict):
+        """Journals and applies a record another kiosk built with
+        signInRecord(), signOutRecord() or signOutAllRecord() and journaled
+        under its own Key. Sending the same record twice applies it once.
+        Returns what applyRecord does."""
+        if record.get("Op") not in ("signin", "signout", "signoutall") or not isinstance(
+            record.get("Key"), str
+        ):
+            raise ValidationError(f"Not a journal record: {record!r}")
+        if record["Op"] == "signin":
+            checkName(record["FirstName"], record["LastName"])
+        return self.applyRecord(self._journal(record))
+
+    def applyRecord(self, record: dict):
+        """Applies a journal record to the database in its own transaction.
+
+        Records already applied are skipped, so replaying is always safe.
+        Returns the visit Id for a sign in, (FirstName, LastName) or None for
+        a sign out and how many were signed out for a sign out all."""
+        with self.db.transaction() as conn:
+            applied = conn.execute(
+                "SELECT Result, Detail FROM JournalApplied WHERE Key = ?", (record["Key"],)
+            ).fetchone()
+            if applied is not None:
+                # Whoever applied it first, the answer is the same
+                if record["Op"] == "signout":
+                    return tuple(json.loads(applied[1])) if applied[1] else None
+                return applied[0]
+            result = stored = detail = None
+            if record["Op"] == "signin":
+                result = stored = conn.execute(
+                    """INSERT INTO Visitors (FirstName, LastName, TimeIn, DateIn, EpochIn, Token) VALUES (?, ?, ?, ?, ?, ?)""",
+                    (
+                        record["FirstName"],
+                        record["LastName"],
+                        record["TimeIn"],
+                        record["DateIn"],
+                        record["EpochIn"],
+                        record["Token"],
+                    ),
+                ).lastrowid
+            elif record["Op"] == "signout":
+                where, params = "Id = ?", (record["Id"],)
+                if record["Secret"] is not None:
+                    where, params = "Id = ? AND Token = ?", (record["Id"], record["Secret"])
+                conn.execute(
+                    f"""INSERT INTO PastVisitors (FirstName, LastName, TimeIn, DateIn, TimeOut, DateOut, EpochIn, EpochOut)
+                    SELECT FirstName, LastName, TimeIn, DateIn, ?, ?, EpochIn, ? FROM Visitors WHERE {where}""",
+                    (record["TimeOut"], record["DateOut"], record["EpochOut"], *params),
+                )
+                result = conn.execute(
+                    f"""DELETE FROM Visitors WHERE {where} RETURNING FirstName, LastName""",
+                    params,
+                ).fetchone()
+                if result is not None:
+                    result = tuple(result)
+                    detail = json.dumps(result)
+            elif record["Op"] == "signoutall":
+                # Only visits from before it, in case it's replayed later
+                where = "EpochIn IS NULL OR EpochIn <= ?"
+                conn.execute(
+                    f"""INSERT INTO PastVisitors (FirstName, LastName, TimeIn, DateIn, TimeOut, DateOut, EpochIn, EpochOut)
+                    SELECT FirstName, LastName, TimeIn, DateIn, ?, ?, EpochIn, ? FROM Visitors WHERE {where} ORDER BY Id""",
+                    (record["TimeOut"], record["DateOut"], record["EpochOut"], record["EpochOut"]),
+                )
+                result = stored = conn.execute(
+                    f"DELETE FROM Visitors WHERE {where}", (record["EpochOut"],)
+                ).rowcount
+            else:
+                raise ValueError(f"Unknown journal record {record['Op']!r}")
+            if record["Key"] is not None:
+                conn.execute(
+                    "INSERT INTO JournalApplied (Key, Result, Detail, Epoch) VALUES (?, ?, ?, ?)",
+                    (record["Key"], stored, detail, getEpoch()),
+                )
+            return result
+
+    def recover(self):
+        """Applies everything in the journal the database missed, then empties
+        the journal. Returns how many records it went through."""
+        count = self.journal.replay(self.applyRecord)
+        self.db.execute(
+            "DELETE FROM JournalApplied WHERE Epoch < ?", getEpoch() - KEEP_APPLIED
+        )
+        return count
+
+    # Students
+
+    def rosterStudents(self):
+        """(FirstName, LastName, Grade) for every student on the roster"""
+        return self.db.execute("SELECT FirstName, LastName, Grade FROM Students", fetch=2)
+
+    def loadRoster(self):
+        """Reads the student roster into memory for suggestions and checks"""
+        self.roster.load(self.rosterStudents())
+        return self.roster
+
+    def importRoster(self, lines):
+        """Upserts students from CSV lines and reloads the roster"""
+        count = roster.importRoster(lines, self.path)
+        self.loadRoster()
+        return count
+
+    def suggestStudents(self, fname: str, lname: str, grade=None, limit=8):
+        """Roster students whose names start with what's been typed so far"""
+        return self.roster.suggest(fname, lname, grade or None, limit)
+
+    def checkStudent(self, fname: str, lname: str, grade: int):
+        checkName(fname, lname)
+        if not grade:
+            raise ValidationError("You must select a grade")
+        # Without a roster there's nothing to check the name against
+        if len(self.roster) and (fname, lname, grade) not in self.roster:
+            raise ValidationError(f"{fname} {lname} isn't in grade {grade}")
+
+    def addStudentEvent(self, fname: str, lname: str, grade: int, kind: str):
+        """Records a STUDENT_LATE or STUDENT_EARLY student without printing"""
+        fname, lname = normalizeName(fname), normalizeName(lname)
+        self.checkStudent(fname, lname, grade)
+        logging.info("%s %s %s", fname, lname, "came in late" if kind == STUDENT_LATE else "left early")
+        self.studentEventLog.add(fname, lname, grade, kind, getEpoch())
+
+    def studentLate(self, fname: str, lname: str, grade: int, printCallback=None):
+        """Records a late student and prints their late slip"""
+        self.addStudentEvent(fname, lname, grade, STUDENT_LATE)
+        name = f"{normalizeName(fname)} {normalizeName(lname)}"
+        logging.info("Printing late slip for %s", name)
+        return self.printSlip(printer.lateSlip(name), printCallback)
+
+    def studentEarly(self, fname: str, lname: str, grade: int):
+        self.addStudentEvent(fname, lname, grade, STUDENT_EARLY)
+
+    def studentEvents(self, grade=None, start=None, end=None, kind=None):
+        """(FirstName, LastName, Grade, Type, Epoch) for late and early students,
+        oldest first. start/end are epoch bounds and kind is STUDENT_LATE or
+        STUDENT_EARLY; leave any of them out to not filter on it."""
+        self.studentEventLog.flush()
+        clauses, params = [], []
+        if grade is not None:
+            clauses.append("Grade = ?")
+            params.append(grade)
+        if start is not None:
+            clauses.append("Epoch >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("Epoch < ?")
+            params.append(end)
+        if kind is not None:
+            clauses.append("Type = ?")
+            params.append(kind)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self.db.execute(
+            f"SELECT FirstName, LastName, Grade, Type, Epoch FROM StudentEvents {where} ORDER BY Epoch, Id",
+            *params,
+            fetch=2,
+        )
+
+    # Analytics
+
+    def dailyVisits(self, start=None, end=None):
+        """(Day, SignIns, SignOuts, average minutes) from the rollups"""
+        return analytics.dailyVisits(self.path, start, end)
+
+    def hourlyVisits(self, start=None, end=None):
+        return analytics.hourlyVisits(self.path, start, end)
+
+    def studentsByGrade(self, start=None, end=None):
+        """(Grade, late, early) from the rollups"""
+        self.studentEventLog.flush()
+        return analytics.studentsByGrade(self.path, start, end)
+
+    def rebuildAnalytics(self):
+        self.studentEventLog.flush()
+        return analytics.rebuild(self.path)
+
+    # Admins
+
+    def loadAdmins(self):
+        """Reads the admins into self.admins, dropping any that were removed"""
+        replaceAdmins(self.admins, auth.loadAdmins(self.path))
+        return self.admins
+
+    def adminNames(self):
+        """Every admin's username, without their password hashes"""
+        return sorted(self.loadAdmins())
+
+    def addAdmin(self, username: str, password: str, name: str):
+        logging.warning("Adding new admin: %s:%s", name, username)
+        auth.addAdmin(self.admins, username, password, name, self.path)
+
+    def checkLogin(self, username: str, password: str):
+        username = username.lower()
+        if username not in self.admins:
+            # Added since the admins were loaded, by cli.py or another kiosk
+            self.loadAdmins()
+        return auth.checkLogin(self.admins, username, password, self.path)
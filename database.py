@@ -0,0 +1,240 @@
+import contextlib
+import logging
+import queue
+import sqlite3
+import threading
+
+# Statements run by the kiosk are a small fixed set, so a cache this size keeps
+# every one of them prepared for the life of the connection.
+STATEMENT_CACHE = 128
+POOL_SIZE = 4
+BUSY_TIMEOUT = 5.0
+FLUSH_INTERVAL = 1.0  # seconds
+FLUSH_SIZE = 100  # rows
+
+
+class Database:
+    """A small pool of long-lived connections to one SQLite file.
+
+    Connections are opened lazily, put in WAL mode with synchronous=NORMAL so a
+    commit doesn't fsync the main database file, and handed out one per thread
+    at a time through `connection()`.
+
+    Writes through `transaction()` all go through one more connection, one
+    thread at a time. Threads waiting to write queue on a lock and go the
+    moment it's free, rather than each polling SQLite's busy handler."""
+
+    def __init__(self, path="data.db", size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        self._watch = None
+        self._watchLock = threading.Lock()
+        self._writer = None
+        self._writeLock = threading.Lock()
+        self._buffers = []
+
+    def _connect(self):
+        logging.debug("Opening connection to %s", self.path)
+        conn = sqlite3.connect(
+            self.path,
+            timeout=BUSY_TIMEOUT,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def _checkout(self):
+        if self._closed:
+            raise sqlite3.ProgrammingError(f"Database {self.path} is closed")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._opened -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=BUSY_TIMEOUT)
+        except queue.Empty:
+            # Callers cope with sqlite3.Error, like a database that stayed locked
+            raise sqlite3.OperationalError(f"Database {self.path} pool exhausted") from None
+
+    def _checkin(self, conn):
+        if self._closed:
+            conn.close()
+            return
+        self._idle.put(conn)
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Checks out a connection, committing on success and rolling back on error"""
+        conn = self._checkout()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._checkin(conn)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Like connection(), but on the writer connection, taking the write lock
+        up front with BEGIN IMMEDIATE"""
+        with self._writeLock:
+            if self._closed:
+                raise sqlite3.ProgrammingError(f"Database {self.path} is closed")
+            if self._writer is None:
+                self._writer = self._connect()
+            with self._writer as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                yield conn
+
+    def execute(self, command: str, *replace, fetch=0):
+        with self.connection() as conn:
+            cursor = conn.execute(command, replace)
+            try:
+                if not fetch:
+                    return cursor
+                if fetch == 1:
+                    return cursor.fetchone()
+                return cursor.fetchall()
+            finally:
+                if fetch:
+                    cursor.close()
+
+    def buffer(self, command: str, interval=FLUSH_INTERVAL, size=FLUSH_SIZE):
+        """A WriteBuffer for command that's flushed when this database closes"""
+        writes = WriteBuffer(self, command, interval, size)
+        self._buffers.append(writes)
+        return writes
+
+    def dataVersion(self):
+        """A number that changes whenever anything else commits to the database.
+
+        It's read from a connection of its own that never writes, so commits
+        from the pool and from other processes both show up."""
+        with self._watchLock:
+            if self._watch is None:
+                self._watch = self._connect()
+            return self._watch.execute("PRAGMA data_version").fetchone()[0]
+
+    def close(self):
+        for writes in self._buffers:
+            try:
+                writes.close()
+            except sqlite3.Error as e:
+                logging.critical("Lost %s buffered writes: %s", writes.pending(), e)
+        self._buffers.clear()
+        self._closed = True
+        with self._watchLock:
+            if self._watch is not None:
+                self._watch.close()
+                self._watch = None
+        with self._writeLock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._opened = 0
+
+
+class WriteBuffer:
+    """Collects rows for one INSERT and writes them in batches.
+
+    add() only appends to a list. A worker thread writes everything waiting
+    with one executemany in one transaction every `interval` seconds, or as
+    soon as `size` rows are waiting, so a burst of writes shares a commit.
+    flush() writes what's waiting straight away; call it before reading the
+    table back."""
+
+    def __init__(self, db: Database, command: str, interval=FLUSH_INTERVAL, size=FLUSH_SIZE):
+        self.db = db
+        self.command = command
+        self.interval = interval
+        self.size = size
+        self._rows = []
+        self._lock = threading.Lock()
+        # Held for a whole flush so batches are written in the order they came
+        self._flushLock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._worker = threading.Thread(target=self._run, name="writebuffer", daemon=True)
+        self._worker.start()
+
+    def add(self, *row):
+        with self._lock:
+            self._rows.append(row)
+            full = len(self._rows) >= self.size
+        if full:
+            self._wake.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._rows)
+
+    def flush(self):
+        """Writes every waiting row and returns how many there were"""
+        with self._flushLock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+            if not rows:
+                return 0
+            try:
+                with self.db.transaction() as conn:
+                    conn.executemany(self.command, rows)
+            except sqlite3.Error:
+                # Put them back to be tried again with the next batch
+                with self._lock:
+                    self._rows[:0] = rows
+                raise
+            return len(rows)
+
+    def close(self):
+        self._stopped = True
+        self._wake.set()
+        self._worker.join()
+        self.flush()
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                logging.error("Writing %s buffered rows failed: %s", self.pending(), e)
+
+
+_databases = {}
+_databasesLock = threading.Lock()
+
+
+def getDatabase(path="data.db"):
+    """Returns the shared pool for path, creating it on first use"""
+    with _databasesLock:
+        if path not in _databases:
+            _databases[path] = Database(path)
+        return _databases[path]
+
+
+def closeAll():
+    with _databasesLock:
+        for db in _databases.values():
+            db.close()
+        _databases.clear()
@@ -1,10 +1,304 @@
+import logging
 import os
+import socket
+import socketserver
+import struct
 import subprocess
 import base64
+import threading
+import time
+
+DEVICE = "/dev/usb/lp0"
+SOCKET = os.environ.get("PRINTERD_SOCKET", "/run/printerd.sock")
+RAW_PORT = 9100
+
+# printerd protocol: on connecting, the daemon sends a 4 byte big-endian length
+# and the path of the device it writes. The client then sends a length
+# followed by the ESC/POS bytes, and the daemon answers each job with one
+# status byte.
+# printerd.py keeps its own copy of these, since it runs as root and imports
+# nothing from the kiosk's directory.
+FRAME = struct.Struct(">I")
+MAX_JOB = 1 << 20
+STATUS_OK = 0
+STATUS_NOT_FOUND = 1
+STATUS_IO_ERROR = 2
+
+
+def recvExactly(sock: socket.socket, size: int):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("printerd connection closed")
+        data += chunk
+    return bytes(data)
+
+
+class Backend:
+    """Somewhere to send ESC/POS bytes.
+
+    send() raises FileNotFoundError when there is no printer and IOError when
+    writing to it failed, which is what the rest of the kiosk expects."""
+
+    def isConnected(self):
+        raise NotImplementedError
+
+    def send(self, data: bytes):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class FileBackend(Backend):
+    """Writes straight to a file, FIFO or device node, keeping it open between jobs"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    def isConnected(self):
+        return os.path.exists(self.path)
+
+    def send(self, data: bytes):
+        with self._lock:
+            try:
+                if self._file is None:
+                    # Don't create a regular file where a device node should be
+                    if not os.path.exists(self.path):
+                        raise FileNotFoundError("Printer Not Found")
+                    self._file = open(self.path, "ab", buffering=0)
+                self._file.write(data)
+            except OSError as e:
+                # Only look at the filesystem again once something has gone wrong
+                self._close()
+                if not os.path.exists(self.path):
+                    raise FileNotFoundError("Printer Not Found")
+                raise IOError(e)
+
+    def _close(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+
+class UsbBackend(Backend):
+    """The USB printer, written by printerd or, without it, intermediary.py"""
+
+    def __init__(self, device=DEVICE, socketPath=SOCKET):
+        self.device = device
+        self.socketPath = socketPath
+        self._daemon = None
+        self._lock = threading.Lock()
+
+    def isConnected(self):
+        return os.path.exists(self.device)
+
+    def send(self, data: bytes):
+        if self._daemon is not None or os.path.exists(self.socketPath):
+            if self._daemonSend(data):
+                return
+        _protectedSend(data, self.device)
+
+    def _daemonSend(self, data: bytes):
+        """Sends a job through printerd. Returns False without sending it if
+        nothing is listening on the socket, or printerd writes another device."""
+        with self._lock:
+            # One retry covers a daemon restart since the last job
+            for attempt in range(2):
+                try:
+                    if self._daemon is None:
+                        daemon = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                        try:
+                            daemon.connect(self.socketPath)
+                        except (ConnectionRefusedError, FileNotFoundError):
+                            # The socket file of a printerd that died, or none at all
+                            daemon.close()
+                            return False
+                        self._daemon = daemon
+                        (size,) = FRAME.unpack(recvExactly(daemon, FRAME.size))
+                        served = recvExactly(daemon, size).decode()
+                        if os.path.realpath(served) != os.path.realpath(self.device):
+                            logging.warning("printerd writes %s, not %s", served, self.device)
+                            self._disconnect()
+                            return False
+                    self._daemon.sendall(FRAME.pack(len(data)) + data)
+                    status = recvExactly(self._daemon, 1)[0]
+                    break
+                except OSError:
+                    self._disconnect()
+                    if attempt:
+                        raise
+        if status == STATUS_NOT_FOUND:
+            raise FileNotFoundError("Printer Not Found")
+        if status != STATUS_OK:
+            raise IOError(f"printerd failed to write the job (status {status})")
+        return True
+
+    def _disconnect(self):
+        if self._daemon is not None:
+            self._daemon.close()
+            self._daemon = None
+
+    def close(self):
+        with self._lock:
+            self._disconnect()
+
+
+class MemoryBackend(Backend):
+    """Keeps every job in memory with the time it was sent, for tests and benchmarks.
+
+    Set `connected` to False to act like an unplugged printer."""
+
+    def __init__(self):
+        self.jobs = []
+        self.connected = True
+        self._lock = threading.Lock()
+
+    def isConnected(self):
+        return self.connected
+
+    def send(self, data: bytes):
+        if not self.connected:
+            raise FileNotFoundError("Printer Not Found")
+        with self._lock:
+            self.jobs.append((time.monotonic(), bytes(data)))
+
+    @property
+    def data(self):
+        """Everything that has been sent, as one byte string"""
+        with self._lock:
+            return b"".join(job for _, job in self.jobs)
+
+    def clear(self):
+        with self._lock:
+            self.jobs.clear()
+
+
+class NetworkBackend(Backend):
+    """A network printer taking raw ESC/POS on a TCP port (usually 9100)"""
+
+    def __init__(self, host, port=RAW_PORT, timeout=5.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._sock = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._sock is None:
+            self._sock = socket.create_connection(
+                (self.host, self.port), timeout=self.timeout
+            )
+        return self._sock
+
+    def isConnected(self):
+        with self._lock:
+            try:
+                self._connect()
+            except OSError:
+                return False
+            return True
+
+    def send(self, data: bytes):
+        with self._lock:
+            try:
+                self._connect()
+            except OSError:
+                raise FileNotFoundError("Printer Not Found")
+            try:
+                self._sock.sendall(data)
+            except OSError as e:
+                self._disconnect()
+                raise IOError(e)
+
+    def _disconnect(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def close(self):
+        with self._lock:
+            self._disconnect()
+
+
+class _StandInHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while chunk := self.request.recv(65536):
+            self.server.capture.send(chunk)
+
+
+class StandInPrinter(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """A local raw-port printer that records what it receives into `capture`.
+
+    Point a NetworkBackend at `server_address` to exercise the network path
+    without a printer. Bytes are recorded as they arrive, so one job may be
+    split over several capture entries."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0):
+        super().__init__((host, port), _StandInHandler)
+        self.capture = MemoryBackend()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def makeBackend(spec: str):
+    """Builds a backend from a spec like "usb", "usb:/dev/usb/lp1", "file:/tmp/slips",
+    "memory" or "net:192.168.1.50:9100" """
+    kind, _, arg = spec.partition(":")
+    if kind == "usb":
+        return UsbBackend(arg or DEVICE)
+    if kind == "file":
+        return FileBackend(arg)
+    if kind == "memory":
+        return MemoryBackend()
+    if kind == "net":
+        host, _, port = arg.rpartition(":")
+        if not host:
+            host, port = arg, ""
+        return NetworkBackend(host, int(port) if port else RAW_PORT)
+    raise ValueError(f"Unknown printer backend {spec!r}")
+
+
+_backend = None
+
+
+def getBackend():
+    global _backend
+    if _backend is None:
+        _backend = makeBackend(os.environ.get("PRINTER_BACKEND", "usb"))
+    return _backend
+
+
+def setBackend(backend: Backend):
+    """Swaps the printer backend and returns the old one"""
+    global _backend
+    old, _backend = _backend, backend
+    return old
 
 
 def isPrinterConnected():
-    return os.path.exists("/dev/usb/lp0")
+    return getBackend().isConnected()
 
 
 def printIfConnected(commands: bytes):
@@ -14,15 +308,15 @@ def printIfConnected(commands: bytes):
         raise FileNotFoundError("Printer Not Found")
 
 
-def _protectedSend(command: bytes):
+def _protectedSend(command: bytes, device=DEVICE):
     try:
-        subprocess.check_call(["./intermediary.py", base64.b64encode(command)])
+        subprocess.check_call(["./intermediary.py", base64.b64encode(command), device])
     except subprocess.CalledProcessError as e:
         raise IOError(e)
 
 
 def sendCommand(command: bytes):
-    _protectedSend(command)
+    getBackend().send(command)
 
 
 def binComm(bina):
@@ -0,0 +1,82 @@
+"""Streams visit history out to CSV or JSON Lines, optionally gzipped.
+
+Rows go from the database cursor through a generator straight to the file,
+so exporting years of history takes no more memory than exporting a day."""
+import contextlib
+import csv
+import gzip
+import io
+import json
+import sys
+
+import core
+
+FORMATS = ("csv", "jsonl")
+# Columns and the kiosk method that yields them, on a Kiosk or a RemoteKiosk
+TABLES = {
+    "past": (
+        ["FirstName", "LastName", "TimeIn", "DateIn", "TimeOut", "DateOut", "EpochIn", "EpochOut"],
+        "iterPastVisitors",
+    ),
+    "current": (
+        ["Id", "FirstName", "LastName", "TimeIn", "DateIn", "EpochIn"],
+        "iterCurrentVisitors",
+    ),
+}
+
+
+def guessFormat(path: str):
+    """"jsonl" for .jsonl or .jsonl.gz files, otherwise "csv" """
+    return "jsonl" if path.removesuffix(".gz").endswith((".jsonl", ".json")) else "csv"
+
+
+@contextlib.contextmanager
+def openOutput(path: str, compress=None):
+    """A text file to write the export to; "-" is stdout. compress defaults to
+    whether path ends in .gz"""
+    if compress is None:
+        compress = path.endswith(".gz")
+    if path == "-":
+        if compress:
+            with gzip.GzipFile(fileobj=sys.stdout.buffer, mode="wb") as raw:
+                with io.TextIOWrapper(raw, encoding="utf-8", newline="") as out:
+                    yield out
+        else:
+            yield sys.stdout
+        return
+    if compress:
+        with gzip.open(path, "wt", encoding="utf-8", newline="") as out:
+            yield out
+    else:
+        with open(path, "w", encoding="utf-8", newline="") as out:
+            yield out
+
+
+def writeRows(rows, columns, out, format="csv"):
+    """Writes rows to out one at a time and returns how many there were"""
+    count = 0
+    if format == "csv":
+        writer = csv.writer(out)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    elif format == "jsonl":
+        for row in rows:
+            out.write(json.dumps(dict(zip(columns, row))))
+            out.write("\n")
+            count += 1
+    else:
+        raise ValueError(f"Can't export as {format!r}")
+    return count
+
+
+def export(kiosk: core.Kiosk, table: str, path: str, format=None, compress=None, **filters):
+    """Exports "past" or "current" visits to path and returns how many rows
+    it wrote. filters are name, start and end, like Kiosk.pastVisitorsPage."""
+    columns, method = TABLES[table]
+    with openOutput(path, compress) as out:
+        return writeRows(
+            getattr(kiosk, method)(**filters), columns, out, format or guessFormat(path)
+        )
+
@@ -4,8 +4,9 @@ import base64
 import sys
 
 data = sys.argv[1]
+device = sys.argv[2] if len(sys.argv) > 2 else "/dev/usb/lp0"
 
 try:
-    subprocess.check_call(["sudo", "python", "writer.py", data])
+    subprocess.check_call(["sudo", "python", "writer.py", data, device])
 except subprocess.CalledProcessError:
     exit(1)
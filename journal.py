@@ -0,0 +1,165 @@
+"""An append-only journal that sign ins and outs are written to before the
+database, so a locked database or a disk hiccup can't lose them.
+
+Each record is a 4 byte big-endian length, a 4 byte CRC32 and that many bytes
+of JSON. Appends from every thread are written and fsynced together by one
+writer thread, so a burst of sign ins shares one fsync. A record cut short by
+a crash fails its length or CRC check and is dropped, along with anything
+after it.
+
+The file is locked with flock while it is written or replayed, so the kiosk
+and cli.py can share it."""
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import queue
+import struct
+import threading
+import uuid
+import zlib
+
+HEADER = struct.Struct(">II")
+# Records bigger than this can only be a corrupt length
+MAX_RECORD = 64 * 1024
+# How long append() waits for its fsync before giving up, in seconds
+WRITE_TIMEOUT = 5.0
+
+
+def journalPath(databasePath: str):
+    return os.path.splitext(databasePath)[0] + ".journal"
+
+
+def encode(record: dict):
+    payload = json.dumps(record, separators=(",", ":")).encode()
+    return HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+class Journal:
+    def __init__(self, path="data.journal"):
+        self.path = path
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        # flock only keeps other processes out, this keeps other threads out
+        self._lock = threading.Lock()
+        self._pending = queue.Queue()
+        with self._locked():
+            self._dropTornTail()
+        self._writer = threading.Thread(target=self._run, name="journal", daemon=True)
+        self._writer.start()
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def append(self, record: dict):
+        """Adds a Key to record, unless it has one, and returns once it's on
+        disk. Raises OSError if writing it failed or took over WRITE_TIMEOUT;
+        it may still be written later, under the same Key."""
+        record = dict(record, Key=record.get("Key") or uuid.uuid4().hex)
+        done = threading.Event()
+        entry = [encode(record), done, None]
+        self._pending.put(entry)
+        if not done.wait(WRITE_TIMEOUT):
+            raise OSError(f"Writing to {self.path} took over {WRITE_TIMEOUT}s")
+        if entry[2] is not None:
+            raise entry[2]
+        return record
+
+    def records(self):
+        """Every whole record in the journal, oldest first"""
+        with open(self.path, "rb") as journal:
+            yield from (record for _, record in self._read(journal))
+
+    def replay(self, apply):
+        """Calls apply(record) for every record in order, then empties the
+        journal. apply has to skip records it's already applied, since
+        records stay until everything before them has gone through. If it
+        raises, the journal is left as it is and the error is passed on."""
+        with self._locked():
+            count = 0
+            for record in self.records():
+                apply(record)
+                count += 1
+            os.ftruncate(self._fd, 0)
+            os.fsync(self._fd)
+        return count
+
+    def close(self):
+        self._pending.put(None)
+        self._writer.join()
+        os.close(self._fd)
+
+    @staticmethod
+    def _read(journal):
+        # Yields (end offset, record) until the data runs out or stops making sense
+        while True:
+            header = journal.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return
+            length, crc = HEADER.unpack(header)
+            if length > MAX_RECORD:
+                return
+            payload = journal.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                return
+            yield journal.tell(), json.loads(payload)
+
+    def _dropTornTail(self):
+        end = 0
+        with open(self.path, "rb") as journal:
+            for end, _ in self._read(journal):
+                pass
+            size = journal.seek(0, os.SEEK_END)
+        if size != end:
+            logging.critical(
+                "Dropping %s bytes of torn record from %s", size - end, self.path
+            )
+            os.ftruncate(self._fd, end)
+            os.fsync(self._fd)
+
+    def _write(self, data: bytes):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self._fd, view) :]
+        os.fsync(self._fd)
+
+    def _run(self):
+        while (entry := self._pending.get()) is not None:
+            batch = [entry]
+            # Whatever else queued up while the last fsync ran goes in this one
+            while True:
+                try:
+                    entry = self._pending.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is None:
+                    self._pending.put(None)
+                    break
+                batch.append(entry)
+            # Any failure, even taking the lock, goes back to the appenders;
+            # if it killed this thread they'd wait on it forever
+            try:
+                with self._locked():
+                    start = os.fstat(self._fd).st_size
+                    try:
+                        self._write(b"".join(data for data, _, _ in batch))
+                    except OSError:
+                        # Cut off anything half written so later records can be read
+                        try:
+                            os.ftruncate(self._fd, start)
+                        except OSError:
+                            pass
+                        raise
+            except OSError as e:
+                logging.critical("Writing %s journal records failed: %s", len(batch), e)
+                for entry in batch:
+                    entry[2] = e
+            for entry in batch:
+                entry[1].set()
+
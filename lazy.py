@@ -0,0 +1,24 @@
+import importlib.util
+import sys
+
+
+def lazyImport(name: str):
+    """Returns the module `name` without running it until an attribute is first used.
+
+    For heavy modules that only some code paths need, so they don't slow down
+    startup."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    if "." in name:
+        # Like a real import, so `import http.client` then `http.client` works
+        parent, _, child = name.rpartition(".")
+        setattr(sys.modules[parent], child, module)
+    loader.exec_module(module)
+    return module
@@ -0,0 +1,84 @@
+import atexit
+import gzip
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+
+FORMAT = "%(asctime)s:%(levelname)s:%(funcName)s:%(message)s"
+DEBUG_LOG_SIZE = 5 * 1024 * 1024
+DEBUG_LOG_COUNT = 5
+LOG_DAYS = 30
+
+_listener = None
+
+
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    """Queues the record as is, leaving the %-formatting to the listener thread"""
+
+    def prepare(self, record):
+        return record
+
+
+def _gzipNamer(name):
+    return name + ".gz"
+
+
+def _gzipRotator(source, dest):
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+def _compressed(handler):
+    handler.namer = _gzipNamer
+    handler.rotator = _gzipRotator
+    return handler
+
+
+def setupLogging(debugLog="debug.log", log="log.log"):
+    """Sends all logging through a queue to a listener thread that does the writes.
+
+    debug.log gets everything and rotates by size, log.log gets warnings and up
+    and rotates daily, and errors also go to stderr. Old logs are gzipped.
+    The queue is flushed when the program exits."""
+    global _listener
+    if _listener is not None:
+        return _listener
+    formatter = logging.Formatter(FORMAT)
+    debugHandler = _compressed(
+        logging.handlers.RotatingFileHandler(
+            debugLog, maxBytes=DEBUG_LOG_SIZE, backupCount=DEBUG_LOG_COUNT
+        )
+    )
+    debugHandler.setLevel(logging.DEBUG)
+    logHandler = _compressed(
+        logging.handlers.TimedRotatingFileHandler(
+            log, when="midnight", backupCount=LOG_DAYS
+        )
+    )
+    logHandler.setLevel(logging.WARNING)
+    streamer = logging.StreamHandler()
+    streamer.setLevel(logging.ERROR)
+    for handler in (debugHandler, logHandler, streamer):
+        handler.setFormatter(formatter)
+
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(logging.DEBUG)
+    root.addHandler(_LazyQueueHandler(records))
+    _listener = logging.handlers.QueueListener(
+        records, debugHandler, logHandler, streamer, respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(stopLogging)
+    return _listener
+
+
+def stopLogging():
+    """Writes out anything still queued and stops the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,41 +1,64 @@
 #!/bin/env python3
+import atexit
 import datetime
 import functools
-import inspect
 import sqlite3
 import sys
-import time
-from tkinter import font
-
-import bcrypt
-import pymsgbox
+import threading
+from tkinter import filedialog, font
 
 import logging as logg
-import driver
+import badge
+import client
+import core
+import database as db
+import export
+import lazy
+import logconfig
+import migrations
 import printer
+import printermonitor
+import printqueue
 import tk
 
+pymsgbox = lazy.lazyImport("pymsgbox")
+
 logg.logProcesses = logg.logThreads = logg.logMultiprocessing = False
 
-logg.basicConfig(
-    filename="debug.log",
-    filemode="a",
-    format="%(asctime)s:%(levelname)s:%(funcName)s:%(message)s",
-    level=logg.DEBUG,
-)
 logging = logg.getLogger()
-streamer = logg.StreamHandler()
-streamer.setLevel(logg.ERROR)
-logging.addHandler(streamer)
-logger = logg.FileHandler("log.log")
-logger.setFormatter(
-    logg.Formatter("%(asctime)s:%(levelname)s:%(funcName)s:%(message)s")
-)
-logger.setLevel(logg.WARNING)
-logging.addHandler(logger)
-
-
-if "--test-run" in sys.argv:
+
+DEBUG = True
+# Created by setupWindow() so importing this module doesn't open a window
+window = None
+helv36 = None
+# Created by setupKiosk(), so importing this module starts no threads and
+# opens no journal
+MONITOR = None
+PRINTS = None
+KIOSK = None
+# Filled in the background once the main screen is up
+ADMINS = {}
+ADMINS_LOADED = threading.Event()
+ADMINS_ERROR = None
+# Keystrokes from the barcode scanner, which types like a keyboard
+SCANS = badge.ScanBuffer()
+# The current visitors window, kept open and live once it's been opened
+DASHBOARD = None
+
+
+def setupKiosk():
+    global MONITOR, PRINTS, KIOSK, ADMINS
+    MONITOR = printermonitor.PrinterMonitor()
+    PRINTS = printqueue.PrintQueue(send=MONITOR.printIfConnected)
+    # A kiosk at another entrance shares the database through server.py instead
+    if client.serverUrl() is None:
+        KIOSK = core.Kiosk(prints=PRINTS)
+    else:
+        KIOSK = client.RemoteKiosk(client.serverUrl(), PRINTS)
+    ADMINS = KIOSK.admins
+
+
+def testRun():
     logging.debug("Printing Test")
     try:
         printer.printlate("hello world")
@@ -45,145 +68,200 @@ if "--test-run" in sys.argv:
         logging.critical("Weird exception. Race condition might have occured.")
     exit(0)
 
-DEBUG = True
-window = tk.Tk()
-helv = lambda x: functools.partial(font.Font, weight="bold", family="Helvetica")(size=x)
-helv36 = helv(36)
 
+def loadAdmins():
+    global ADMINS_ERROR
+    logging.debug("Geting admin info")
+    try:
+        KIOSK.loadAdmins()
+    except sqlite3.Error as e:
+        ADMINS_ERROR = e
+        logging.critical("Admin data not found")
+    else:
+        logging.debug("Admin Info: %s", ADMINS)
+    ADMINS_LOADED.set()
 
-def sqldata(command: str, *replace, database="data.db", fetch=0):
-    logging.debug(f'Running sql command "{command}"')
+
+def loadRoster():
     try:
-        CONN = sqlite3.connect(database)
-        CURSOR = CONN.cursor()
-        if not fetch:
-            output = CURSOR.execute(command, replace)
-        elif fetch == 1:
-            output = CURSOR.execute(command, replace).fetchone()
-        else:
-            output = CURSOR.execute(command, replace).fetchall()
-        CURSOR.close()
-        CONN.commit()
-        CONN.close()
-        return output
-    except Exception as e:  # Um... there was an error. Eh, itll be fine
-        # pymsgbox.alert("There was an internal error.\nSome data may be lost.")
-        logging.error(f"Exception executing SQL: {e}")
-        raise sqlite3.Error(e)
-
-
-logging.debug("Geting admin info")
-try:
-    ADMINS = {
-        i[1]: i[2]
-        for i in sqldata("""SELECT Name, Username, PasswordHash FROM Admins""", fetch=2)
-    }
-except sqlite3.Error as e:
-    pymsgbox.alert(
-        "There was an error getting admin info.\nThe program will still work, but the admin console will "
-        "be disabled.",
-        "ERROR",
-    )
-    ADMINS = {}
-    logging.critical("Admin data not found")
-else:
-    logging.debug(f"Admin Info: {ADMINS}")
+        KIOSK.loadRoster()
+    except sqlite3.Error as e:
+        logging.error("Loading the student roster failed: %s", e)
+    else:
+        logging.debug("Loaded %s students", len(KIOSK.roster))
 
 
-def getReadableTime():
-    """Gets the current time in a human-readable format"""
-    return datetime.datetime.now().strftime("%I:%M:%S %p")
+def checkAdminsLoaded():
+    if not ADMINS_LOADED.is_set():
+        window.after(100, checkAdminsLoaded)
+        return
+    if ADMINS_ERROR is not None:
+        pymsgbox.alert(
+            "There was an error getting admin info.\nThe program will still work, but the admin console will "
+            "be disabled.",
+            "ERROR",
+        )
 
 
-def getReadableDate():
-    return datetime.datetime.now().strftime("%m/%d/%Y")
+RECOVER_MS = 60 * 1000
 
 
-def printLateSlip(name: str):
-    """Prints out a late slip using a kiosk printer"""
-    logging.info(f"Printing late slip for {name}")
+def recoverJournal():
+    """Puts any sign ins and outs the database missed into it"""
     try:
-        printer.printlate(name)
-    except FileNotFoundError:
+        count = KIOSK.recover()
+    except (sqlite3.Error, OSError) as e:
+        logging.error("Replaying the journal failed, will try again: %s", e)
+    else:
+        logging.debug("Replayed %s journal records", count)
+
+
+def scheduleRecovery():
+    threading.Thread(target=recoverJournal, name="recover", daemon=True).start()
+    window.after(RECOVER_MS, scheduleRecovery)
+
+
+ARCHIVE_MS = 24 * 60 * 60 * 1000
+
+
+def archiveHistory():
+    """Moves old history out of data.db so it stays small"""
+    try:
+        KIOSK.archiveHistory()
+    except sqlite3.Error as e:
+        logging.error("Archiving old visits failed: %s", e)
+
+
+def scheduleArchiving():
+    threading.Thread(target=archiveHistory, name="archive", daemon=True).start()
+    window.after(ARCHIVE_MS, scheduleArchiving)
+
+
+def startBackgroundLoading():
+    threading.Thread(target=loadAdmins, name="loadadmins", daemon=True).start()
+    threading.Thread(target=loadRoster, name="loadroster", daemon=True).start()
+    checkAdminsLoaded()
+
+
+@functools.cache
+def helv(size: int):
+    """Bold Helvetica at size, made once and shared by every page"""
+    return font.Font(weight="bold", family="Helvetica", size=size)
+
+
+# name -> (Toplevel, reset function) for the pages showPage() has built
+PAGES = {}
+
+
+def showPage(name: str, build):
+    """Shows a page, only building it the first time.
+
+    build() makes the page and returns (toplevel, reset); reset() clears
+    whatever the last person typed and focuses the first box. Closing the
+    page hides it instead of destroying it."""
+    page = PAGES.get(name)
+    if page is None or not page[0].winfo_exists():
+        page = PAGES[name] = build()
+        page[0].protocol("WM_DELETE_WINDOW", functools.partial(hidePage, page[0]))
+    win, reset = page
+    win.deiconify()
+    win.lift()
+    reset()
+    win.grab_set()
+    return win
+
+
+def hidePage(win: tk.Toplevel):
+    win.grab_release()
+    win.withdraw()
+
+
+def clearEntries(*entries: tk.Entry):
+    for entry in entries:
+        entry.delete(0, tk.END)
+
+
+def setupWindow():
+    global window, helv36
+    window = tk.Tk()
+    helv36 = helv(36)
+    PRINTS.attach(window)
+    window.bind_all("<Key>", badgeScanned, add=True)
+
+
+def printDone(errorMessage: str, job: printqueue.PrintJob):
+    """Print queue callback that tells the user if their slip didn't print"""
+    if isinstance(job.error, FileNotFoundError):
         logging.critical("Printer Not found")
-        pymsgbox.alert("Printer error, please talk to Ms.Linda for a late Slip")
-    except IOError:
+        pymsgbox.alert(errorMessage)
+    elif job.error is not None:
         logging.critical("Weird exception. Race condition might have occured.")
 
 
-def validateName(win: tk.Toplevel, FnameEntry: tk.Entry, LnameEntry: tk.Entry):
-    Fname = FnameEntry.get().capitalize()
-    Lname = LnameEntry.get().capitalize()
-    logging.debug(f"Validating Name {Fname} {Lname}")
-    if not (len(Fname) > 0 or len(Lname) > 0):
-        (
-            errLbl := tk.Label(
-                win, background="red", text="You must enter both firstname and lastname"
-            )
-        ).pack()
-        errLbl["font"] = helv(12)
-        logging.info(f"Name validation failed for {Fname} {Lname}")
-    else:
-        logging.debug(f"Adding visitor {Fname} {Lname}")
-        try:
-            sqldata(
-                f"""INSERT INTO Visitors (FirstName, LastName, TimeIn, DateIn) VALUES (?, ?, ? , ?)""",
-                Fname,
-                Lname,
-                getReadableTime(),
-                getReadableDate(),
-            )
-        except sqlite3.Error as e:
-            logging.critical(f"Failed to add visitor {Fname} {Lname}")
-        try:
-            printer.printvisitor(f"{Fname} {Lname}")
-        except FileNotFoundError:
-            logging.critical(f"Printer not found")
-            pymsgbox.alert(
-                "There was an error with the printer. Please talk to Ms. Linda"
-            )
-        except IOError:
-            logging.critical("Weird exception. Race condition might have occured.")
-        else:
-            pymsgbox.alert(
-                "You are successfully signed in!\n Remember to sign out again later",
-                "Success",
-                timeout=10000,
-            )
-        win.destroy()
+def validateName(
+    win: tk.Toplevel, FnameEntry: tk.Entry, LnameEntry: tk.Entry, error: tk.Label
+):
+    logging.debug("Validating Name %s %s", FnameEntry.get(), LnameEntry.get())
+    try:
+        KIOSK.signInVisitor(
+            FnameEntry.get(),
+            LnameEntry.get(),
+            functools.partial(
+                printDone,
+                "There was an error with the printer. Please talk to Ms. Linda",
+            ),
+        )
+    except core.ValidationError as e:
+        error["text"] = str(e)
+        error.pack()
+        logging.info("Name validation failed: %s", e)
+        return
+    except sqlite3.Error as e:
+        logging.critical("Failed to add visitor: %s", e)
+    pymsgbox.alert(
+        "You are successfully signed in!\n Remember to sign out again later",
+        "Success",
+        timeout=10000,
+    )
+    hidePage(win)
 
 
 def StudentValidate(
-    grades: tk.IntVar, win: tk.Toplevel, FName: tk.Entry, LName: tk.Entry, SignIn: bool
+    grades: tk.IntVar,
+    win: tk.Toplevel,
+    FName: tk.Entry,
+    LName: tk.Entry,
+    SignIn: bool,
+    error: tk.Label,
 ):
-    fname = FName.get().capitalize()
-    lname = LName.get().capitalize()
-    logging.debug(f"Validating student {fname} {lname}")
-    if not (fname and lname):
-        logging.info(f"{fname} {lname} failed to validate")
-        tk.Label(
-            win,
-            background="red",
-            text="You must enter both firstname and lastname",
-            font=helv(12),
-        ).grid(columnspan=8)
+    logging.debug("Validating student %s %s", FName.get(), LName.get())
+    try:
+        if SignIn:  # if the function is being called for a sign in.
+            KIOSK.studentLate(
+                FName.get(),
+                LName.get(),
+                grades.get(),
+                functools.partial(
+                    printDone, "Printer error, please talk to Ms.Linda for a late Slip"
+                ),
+            )
+        else:
+            KIOSK.studentEarly(FName.get(), LName.get(), grades.get())
+    except core.ValidationError as e:
+        logging.info("Student failed to validate: %s", e)
+        error["text"] = str(e)
+        error.grid()
         return
-    grade = grades.get()
-    if not grade:
-        tk.Label(
-            win,
-            background="red",
-            text="You must select a grade",
-            font=helv(12),
-        ).grid(columnspan=8)
+    except sqlite3.Error as e:
+        # Only a kiosk using server.py gets here; a late slip still prints
+        logging.critical("Failed to record student %s %s: %s", FName.get(), LName.get(), e)
+        pymsgbox.alert("This could not be saved. Please talk to Ms. Linda", "ERROR", timeout=10000)
+        if SignIn:
+            hidePage(win)
         return
-    if SignIn:  # if the function is being called for a sign in.
-        logging.debug(f"{fname} {lname} came in late")
-        printLateSlip(f"{fname} {lname}")
+    if SignIn:
         pymsgbox.alert("Here is your late slip.", timeout=10000)
-        win.destroy()
-        return
-    logging.info(f"{fname} {lname} left early")
+        hidePage(win)
     return
 
 
@@ -196,7 +274,7 @@ def checkstudent(signIn: bool):
         return
     if not (datetime.time(7) < datetime.datetime.now().time() < datetime.time(16)):
         logging.warning(
-            f"Someone tried to sign {'in' if signIn else 'out'} at a weird time."
+            "Someone tried to sign %s at a weird time.", "in" if signIn else "out"
         )
         pymsgbox.alert("What are you doing at this time?")
         return
@@ -209,7 +287,7 @@ def checkstudent(signIn: bool):
             )
             return
         if datetime.datetime.now().time() > datetime.time(3, 30):
-            logging.warning(f"Someone tried to sign in at a weird time.")
+            logging.warning("Someone tried to sign in at a weird time.")
             pymsgbox.alert(
                 "Hm... I think it's too late for that",
                 "?????",
@@ -218,14 +296,14 @@ def checkstudent(signIn: bool):
         studentSignIn()
         return
     if datetime.datetime.now().time() < datetime.time(15, 15, 0, 0):
-        logging.warning(f"Someone tried to sign out at a weird time.")
+        logging.warning("Someone tried to sign out at a weird time.")
         pymsgbox.alert(
             "Um... It is later than 3:15, you don't need to sign out",
             "?????",
         )
         return
     if datetime.datetime.now().time() < datetime.time(8, 30):
-        logging.warning(f"Someone tried to sign out at a weird time.")
+        logging.warning("Someone tried to sign out at a weird time.")
         pymsgbox.alert(
             "Hm... I think it's too early for that",
             "?????",
@@ -251,6 +329,7 @@ def createStudentPage(title, sign_type, signIN):
             text=f"{i + 1}{'th' if i + 1 not in special else special[i + 1]}",
             value=i + 1,
             variable=selgrde,
+            command=lambda: suggest(),
         )
         grades.append(curr)
         curr.grid(row=2, column=i)
@@ -262,26 +341,70 @@ def createStudentPage(title, sign_type, signIN):
         columnspan=8
     )
     (LnameEntry := tk.Entry(StudentPage, font=helv36)).grid(columnspan=8)
+    (
+        suggestions := tk.Listbox(
+            StudentPage, height=5, font=helv(21), exportselection=False
+        )
+    ).grid(columnspan=8)
+    found = []
+
+    def suggest():
+        found[:] = KIOSK.suggestStudents(
+            nameEntry.get(), LnameEntry.get(), selgrde.get()
+        )
+        suggestions.delete(0, tk.END)
+        for fname, lname, grade in found:
+            suggestions.insert(tk.END, f"{fname} {lname} ({grade})")
+
+    def pick(event):
+        if not suggestions.curselection():
+            return
+        fname, lname, grade = found[suggestions.curselection()[0]]
+        for entry, name in ((nameEntry, fname), (LnameEntry, lname)):
+            entry.delete(0, tk.END)
+            entry.insert(0, name)
+        selgrde.set(grade)
+
+    for entry in (nameEntry, LnameEntry):
+        entry.bind("<KeyRelease>", lambda event: suggest())
+    suggestions.bind("<<ListboxSelect>>", pick)
+    error = tk.Label(StudentPage, background="red", font=helv(12))
     validation_func = functools.partial(
-        StudentValidate, selgrde, StudentPage, nameEntry, LnameEntry, signIN
+        StudentValidate, selgrde, StudentPage, nameEntry, LnameEntry, signIN, error
     )
     tk.Button(
         StudentPage, text=sign_type, bg="green", command=validation_func, font=helv(21)
     ).grid(columnspan=8)
-    StudentPage.focus()
-    nameEntry.focus()
-    StudentPage.grab_set()
+    error.grid(columnspan=8)
+    error.grid_remove()
+
+    def reset():
+        clearEntries(nameEntry, LnameEntry)
+        selgrde.set(0)
+        found.clear()
+        suggestions.delete(0, tk.END)
+        error.grid_remove()
+        StudentPage.focus()
+        nameEntry.focus()
+
+    return StudentPage, reset
 
 
 def studentSignOut():
-    createStudentPage("Student Sign Out", "Sign Out", False)
+    showPage(
+        "studentOut",
+        functools.partial(createStudentPage, "Student Sign Out", "Sign Out", False),
+    )
 
 
 def studentSignIn():
-    createStudentPage("Student Sign In", "Sign In", True)
+    showPage(
+        "studentIn",
+        functools.partial(createStudentPage, "Student Sign In", "Sign In", True),
+    )
 
 
-def visitorinpage():
+def createVisitorInPage():
     visitorquestion = tk.Toplevel(bg="orange")
     visitorquestion.title("Visitor Sign In")
     visitorquestion.config(width=300, height=200)
@@ -289,39 +412,77 @@ def visitorinpage():
     (nameEntry := tk.Entry(visitorquestion, font=helv36)).pack()
     tk.Label(visitorquestion, text="Last Name:", background="blue", font=helv36).pack()
     (LnameEntry := tk.Entry(visitorquestion, font=helv36)).pack()
-    validation = functools.partial(validateName, visitorquestion, nameEntry, LnameEntry)
+    error = tk.Label(visitorquestion, background="red", font=helv(12))
+    validation = functools.partial(
+        validateName, visitorquestion, nameEntry, LnameEntry, error
+    )
     tk.Button(
         visitorquestion, text="Sign In", bg="green", command=validation, font=helv(21)
     ).pack()
-    visitorquestion.focus()
-    nameEntry.focus()
-    visitorquestion.grab_set()
-    return
 
+    def reset():
+        clearEntries(nameEntry, LnameEntry)
+        error.pack_forget()
+        visitorquestion.focus()
+        nameEntry.focus()
 
-def processSignOut(win: tk.Toplevel, Fnamebox: tk.Entry, Lnamebox: tk.Entry):
-    Fname = Fnamebox.get().capitalize()
-    Lname = Lnamebox.get().capitalize()
-    signedIn = sqldata("SELECT FirstName, LastName FROM Visitors", fetch=2)
-    if (Fname, Lname) not in signedIn:
-        logging.info(f"Visitor {Fname} {Lname} was never signed in")
-        pymsgbox.alert(
-            f"Visitor {Fname} {Lname} not found in database, please check your spelling",
-            timeout=30000,
-        )
-        return
+    return visitorquestion, reset
+
+
+def visitorinpage():
+    showPage("visitorIn", createVisitorInPage)
+
+
+def processSignOut(
+    win: tk.Toplevel, Fnamebox: tk.Entry, Lnamebox: tk.Entry, matches: tk.Listbox
+):
+    Fname = core.normalizeName(Fnamebox.get())
+    Lname = core.normalizeName(Lnamebox.get())
+    if matches.curselection():
+        visitorId = matches.visitorIds[matches.curselection()[0]]
+    else:
+        visitorIds = KIOSK.findVisitors(Fname, Lname)
+        if len(visitorIds) > 1:
+            pymsgbox.alert(
+                f"More than one {Fname} {Lname} is signed in, please pick yourself from the list",
+                timeout=30000,
+            )
+            return
+        if not visitorIds:
+            logging.info("Visitor %s %s was never signed in", Fname, Lname)
+            pymsgbox.alert(
+                f"Visitor {Fname} {Lname} not found in database, please pick your name from the list"
+                if matches.visitorIds
+                else f"Visitor {Fname} {Lname} not found in database, please check your spelling",
+                timeout=30000,
+            )
+            return
+        visitorId = visitorIds[0]
     try:
-        signout(Fname, Lname)
+        signout(visitorId)
     except sqlite3.Error as e:
-        logging.error(f"Signing {Fname} {Lname} out failed: {e}")
+        logging.error("Signing visitor %s out failed: %s", visitorId, e)
     else:
-        logging.debug(f"Visitor {Fname} {Lname} signed out")
+        logging.debug("Visitor %s signed out", visitorId)
     pymsgbox.alert("You have been successfully signed out", timeout=20000)
-    win.destroy()
+    hidePage(win)
     return
 
 
-def visitoroutpage():
+def showMatches(Fnamebox: tk.Entry, Lnamebox: tk.Entry, matches: tk.Listbox):
+    """Fills the sign out list with the visitors most like what's been typed"""
+    try:
+        found = KIOSK.searchVisitors(f"{Fnamebox.get()} {Lnamebox.get()}")
+    except sqlite3.Error as e:
+        logging.error("Searching visitors failed: %s", e)
+        found = []
+    matches.delete(0, tk.END)
+    matches.visitorIds = [row[0] for row in found]
+    for _, fname, lname, timeIn, dateIn in found:
+        matches.insert(tk.END, f"{fname} {lname}  (in at {timeIn} {dateIn})")
+
+
+def createVisitorOutPage():
     visitorquestion = tk.Toplevel(bg="orange")
     visitorquestion.title("Visitor Sign Out")
     visitorquestion.config(width=300, height=200)
@@ -337,9 +498,25 @@ def visitoroutpage():
     (LnameEntry := tk.Entry(visitorquestion)).pack()
     LnameLabel["font"] = helv36
     LnameEntry["font"] = helv36
+    (
+        matches := tk.Listbox(
+            visitorquestion, height=5, width=40, font=helv(16), exportselection=False
+        )
+    ).pack()
+    matches.visitorIds = []
+    tk.Label(
+        visitorquestion,
+        text="Or scan the barcode on your slip",
+        background="orange",
+        font=helv(16),
+    ).pack()
+    search = functools.partial(showMatches, nameEntry, LnameEntry, matches)
+    for entry in (nameEntry, LnameEntry):
+        entry.bind("<KeyRelease>", lambda event: search())
     validation = functools.partial(
-        processSignOut, visitorquestion, nameEntry, LnameEntry
+        processSignOut, visitorquestion, nameEntry, LnameEntry, matches
     )
+    matches.bind("<Double-Button-1>", lambda event: validation())
     (
         submitName := tk.Button(
             visitorquestion, text="Sign Out", bg="green", command=validation
@@ -347,59 +524,111 @@ def visitoroutpage():
     ).pack()
     submitName["font"] = helv(21)
 
-    visitorquestion.focus()
-    nameEntry.focus()
-    visitorquestion.grab_set()
-    return
+    def reset():
+        clearEntries(nameEntry, LnameEntry)
+        matches.delete(0, tk.END)
+        matches.visitorIds = []
+        visitorquestion.focus()
+        nameEntry.focus()
 
+    return visitorquestion, reset
 
-def signout(fname: str, lname: str):
-    TimeIn, DateIn = sqldata(
-        f"""SELECT TimeIn, DateIn FROM Visitors WHERE FirstName = ? AND LastName = ?""",
-        fname,
-        lname,
-        fetch=1,
-    )
-    sqldata(
-        f"""DELETE FROM Visitors WHERE FirstName = ? AND LastName = ?""",
-        fname,
-        lname,
-    )
-    sqldata(
-        f"""INSERT INTO PastVisitors (FirstName, LastName, TimeIn, DateIn, TimeOut, DateOut) VALUES (?, ?, ?, 
-        ?, ?, ?)""",
-        fname,
-        lname,
-        TimeIn,
-        DateIn,
-        getReadableTime(),
-        getReadableDate(),
-    )
+
+def visitoroutpage():
+    showPage("visitorOut", createVisitorOutPage)
+
+
+def signout(visitorId: int):
+    signedOut = KIOSK.signOutVisitor(visitorId)
+    if signedOut is None:
+        logging.info("Visitor %s was already signed out", visitorId)
+        return
+    fname, lname = signedOut
     pymsgbox.alert(f"{fname} {lname} has been signed out", "Success")
 
 
+def badgeScanned(event):
+    """Signs a visitor out when their slip's barcode is scanned, whatever page
+    or box has focus"""
+    token = SCANS.feed(event.char, event.time)
+    if token is None:
+        return
+    if isinstance(event.widget, tk.Entry):
+        # The scanner typed the token into the box too
+        end = event.widget.index(tk.INSERT)
+        event.widget.delete(max(0, end - len(token)), end)
+    try:
+        signedOut = KIOSK.signOutBadge(token)
+    except sqlite3.Error as e:
+        # It's journaled, so it goes through when the database comes back
+        logging.error("Signing out badge %s failed: %s", token, e)
+        pymsgbox.alert("You have been signed out", timeout=20000)
+        return
+    if signedOut is None:
+        logging.info("Badge %s is not signed in", token)
+        pymsgbox.alert("That slip has already been signed out", timeout=20000)
+        return
+    fname, lname = signedOut
+    logging.debug("Visitor %s %s signed out by badge", fname, lname)
+    pymsgbox.alert(f"Goodbye {fname} {lname}, you have been signed out", timeout=20000)
+
+
 def clearpast():
-    logging.warning("Past was cleared")
-    sqldata("DELETE FROM PastVisitors")
+    KIOSK.clearPast()
 
 
 def signoutall():
-    logging.warning("All were signed out")
-    sqldata(f"DELETE FROM Visitors")
+    if pymsgbox.confirm("Sign out every visitor?", "Sign Out Everyone") != "OK":
+        return
+    runWithProgress(
+        "Signing everyone out...",
+        KIOSK.signOutAll,
+        lambda count: pymsgbox.alert(f"Signed out {count} visitors", "Success"),
+    )
 
 
 def addnewadmin(uname: str, pwd: str, name: str):
-    logging.warning(f"Adding new admin: {name}:{uname}")
-    passwordh = bcrypt.hashpw(pwd.encode(), bcrypt.gensalt())
-    sqldata(
-        f"INSERT INTO Admins (Name, Username, PasswordHash) VALUES (?, ?, ?)",
-        name,
-        uname,
-        passwordh,
-    )
+    KIOSK.addAdmin(uname, pwd, name)
     return "", 204
 
 
+def runWithProgress(message: str, func, done):
+    """Runs func on a worker thread behind a progress window, then calls
+    done(result) back on the Tk thread"""
+    progress = tk.Toplevel()
+    progress.title("Please wait")
+    tk.Label(progress, text=message, font=helv(21)).pack()
+    (bar := tk.Progressbar(progress, mode="indeterminate", length=300)).pack()
+    bar.start(10)
+    progress.grab_set()
+    result = {}
+
+    def work():
+        try:
+            result["value"] = func()
+        except Exception as e:
+            result["error"] = e
+
+    worker = threading.Thread(target=work, daemon=True)
+    worker.start()
+
+    def poll():
+        if worker.is_alive():
+            progress.after(50, poll)
+            return
+        progress.destroy()
+        if "error" in result:
+            logging.error("%s failed: %s", message, result["error"])
+            if isinstance(result["error"], core.ValidationError):
+                pymsgbox.alert(str(result["error"]), "ERROR")
+            else:
+                pymsgbox.alert("There was an internal error.", "ERROR")
+            return
+        done(result["value"])
+
+    progress.after(50, poll)
+
+
 def addnewadmininter():
     name = pymsgbox.prompt(
         "Enter the new admins real name:", "Admin Adder", timeout=60000
@@ -408,6 +637,11 @@ def addnewadmininter():
         return
     if name == "":
         pymsgbox.alert("Invalid name", "Error", timeout=5000)
+    try:
+        # So admins added since startup count as taken
+        KIOSK.loadAdmins()
+    except sqlite3.Error as e:
+        logging.error("Reloading admins failed: %s", e)
     while True:
         username = pymsgbox.prompt(
             "Enter the new admins username:", "Admin Adder", timeout=60000
@@ -470,8 +704,13 @@ def addnewadmininter():
                 "Enter your password one more time to confirm", "Confirm"
             )
             if confirmed == password:
-                addnewadmin(username, password, name)
-                pymsgbox.alert(f"New admin {name} added successfully", "Success")
+                runWithProgress(
+                    "Adding admin...",
+                    functools.partial(addnewadmin, username, password, name),
+                    lambda _: pymsgbox.alert(
+                        f"New admin {name} added successfully", "Success"
+                    ),
+                )
                 return
             if (
                 pymsgbox.confirm(
@@ -485,59 +724,100 @@ def addnewadmininter():
 
 
 def newViewCurrent(currentTop: tk.Toplevel | tk.Tk):
-    Vis = tk.Toplevel(currentTop)
-    Vis.title("Current Visitors")
-    try:
-        visitors = sqldata(
-            "SELECT FirstName, LastName, TimeIn, DateIn FROM Visitors", fetch=2
-        )
-    except sqlite3.Error as e:
-        Vis.destroy()
-        logging.error(f"Error retreiving current visitors: {e}")
-        pymsgbox.alert(
-            "Error loading visitor data. Please check the logs for more info."
-        )
-        return
-    if not visitors:
-        pymsgbox.alert("There are no visitors currently")
-        Vis.destroy()
+    global DASHBOARD
+    if DASHBOARD is not None and DASHBOARD.winfo_exists():
+        DASHBOARD.lift()
+        DASHBOARD.focus()
         return
+    DASHBOARD = Vis = tk.Toplevel(currentTop)
+    Vis.title("Current Visitors")
     heads = ["First Name", "Last Name", "Time Signed In", "Date Signed In"]
     tab = tk.Sheet(
         Vis,
         "Current Visitors",
-        data=visitors,
+        data=[],
         auto_resize_columns=50,
         auto_resize_rows=30,
         width=int((500 / 4) * len(heads)),
-        height=100,  # 100 * len(visitors),
+        height=400,
+    )
+    tab.enable_bindings(
+        "row_height_resize",
+        "arrowkeys",
+        "single_select",
+        "row_select",
+        "right_click_popup_menu",
     )
-    tab.enable_bindings("row_height_resize", "arrowkeys")
     tab.set_header_data(heads)
-    tab.grid(rowspan=len(visitors), columnspan=1, column=0)
-    cnt = 0
-    for fnam, lnam, _, _ in visitors:
-        tk.Button(
-            Vis, text="Sign Out", command=functools.partial(signout, fnam, lnam)
-        ).grid(row=cnt, column=1)
-        cnt += 1
+    tab.grid(row=0, column=0)
+    count = tk.Label(Vis)
+    count.grid(row=1, column=0)
+    watcher = core.VisitorWatcher(KIOSK)
+    # Visit Ids of the sheet's rows, in the same order
+    ids = []
+
+    def signoutSelected():
+        rows = tab.get_selected_rows()
+        if not rows and tab.get_currently_selected():
+            rows = {tab.get_currently_selected().row}
+        for row in sorted(rows):
+            if row < len(ids):
+                try:
+                    signout(ids[row])
+                except sqlite3.Error as e:
+                    logging.error("Signing out visitor %s failed: %s", ids[row], e)
+        refresh(reschedule=False)
+
+    def refresh(reschedule=True):
+        if not Vis.winfo_exists():
+            return
+        try:
+            changes = watcher.poll()
+        except sqlite3.Error as e:
+            logging.error("Error retreiving current visitors: %s", e)
+            changes = None
+        if changes is not None:
+            removed, added = changes
+            removedIds = set(removed)
+            gone = [row for row, visitorId in enumerate(ids) if visitorId in removedIds]
+            if gone:
+                tab.delete_rows(gone, redraw=False)
+                ids[:] = [visitorId for visitorId in ids if visitorId not in removedIds]
+            if added:
+                tab.insert_rows([row[1:] for row in added], redraw=False)
+                ids.extend(row[0] for row in added)
+            tab.redraw()
+            count["text"] = (
+                f"{len(ids)} visitors signed in"
+                if ids
+                else "There are no visitors currently"
+            )
+        if reschedule:
+            Vis.after(500, refresh)
+
+    tab.popup_menu_add_command(
+        "Sign Out", signoutSelected, header_menu=False, empty_space_menu=False
+    )
+    tk.Button(Vis, text="Sign Out Selected", command=signoutSelected).grid(
+        row=2, column=0
+    )
+    refresh()
+
+
+def parseDateEntry(entry: tk.Entry, nextDay=False):
+    """The epoch at the start of the mm/dd/yyyy day typed in entry, or None if blank"""
+    text = entry.get().strip()
+    if not text:
+        return None
+    day = datetime.datetime.strptime(text, "%m/%d/%Y")
+    if nextDay:
+        day += datetime.timedelta(days=1)
+    return int(day.timestamp())
 
 
 def viewPast(currentTop: tk.Toplevel | tk.Tk):
     Vis = tk.Toplevel(currentTop)
     Vis.title("Past Visitors")
-    try:
-        signedout = sqldata(
-            "SELECT FirstName, LastName, TimeIn, DateIn, TimeOut, DateOut FROM PastVisitors",
-            fetch=2,
-        )
-    except sqlite3.Error as e:
-        Vis.destroy()
-        logging.error(f"Error retreiving past visitors: {e}")
-        pymsgbox.alert(
-            "Error loading visitor data. Please check the logs for more info."
-        )
-        return
     heads = [
         "First Name",
         "Last Name",
@@ -546,14 +826,27 @@ def viewPast(currentTop: tk.Toplevel | tk.Tk):
         "Time Signed Out",
         "Date Signed Out",
     ]
+    controls = tk.Frame(Vis)
+    controls.grid(row=0, column=0, sticky="we")
+    tk.Label(controls, text="Name:").pack(side=tk.LEFT)
+    (nameEntry := tk.Entry(controls, width=12)).pack(side=tk.LEFT)
+    tk.Label(controls, text="From:").pack(side=tk.LEFT)
+    (startEntry := tk.Entry(controls, width=10)).pack(side=tk.LEFT)
+    tk.Label(controls, text="To:").pack(side=tk.LEFT)
+    (endEntry := tk.Entry(controls, width=10)).pack(side=tk.LEFT)
+    sortBy = tk.StringVar(value="Time In")
+    tk.OptionMenu(controls, sortBy, *core.PAST_SORTS).pack(side=tk.LEFT)
+    descending = tk.BooleanVar(value=True)
+    tk.Checkbutton(controls, text="Newest first", variable=descending).pack(side=tk.LEFT)
+    count = tk.Label(controls)
     tab = tk.Sheet(
         Vis,
         "Past Visitors",
-        data=signedout,
+        data=[],
         auto_resize_columns=50,
         auto_resize_rows=30,
         width=int((500 / 4) * len(heads)),
-        height=100,  # 100 * len(signedout),
+        height=400,
         row_height=5,
     )
     tab.enable_bindings(
@@ -564,18 +857,127 @@ def viewPast(currentTop: tk.Toplevel | tk.Tk):
         "column_width_resize",
     )
     tab.set_header_data(heads)
-    tab.grid(rowspan=len(signedout))
+    tab.grid(row=1, column=0)
+    # The query the sheet is showing and the key of the last row loaded
+    view = {"filters": {}, "key": None, "done": True}
+
+    def loadPage():
+        rows, view["key"] = KIOSK.pastVisitorsPage(view["key"], **view["filters"])
+        view["done"] = view["key"] is None
+        if rows:
+            tab.insert_rows(rows)
+
+    def apply():
+        try:
+            filters = {
+                "name": nameEntry.get().strip(),
+                "start": parseDateEntry(startEntry),
+                "end": parseDateEntry(endEntry, nextDay=True),
+            }
+        except ValueError:
+            pymsgbox.alert("Dates need to look like 01/31/2024", "ERROR")
+            return
+        try:
+            total = KIOSK.countPastVisitors(**filters)
+            filters["sort"] = core.PAST_SORTS[sortBy.get()]
+            filters["descending"] = descending.get()
+            view.update(filters=filters, key=None)
+            tab.set_sheet_data([])
+            loadPage()
+        except sqlite3.Error as e:
+            logging.error("Error retreiving past visitors: %s", e)
+            pymsgbox.alert(
+                "Error loading visitor data. Please check the logs for more info."
+            )
+            return
+        count["text"] = f"{total} visits"
+
+    def scrolled():
+        # Fetch the next page once the user scrolls near the bottom
+        if not Vis.winfo_exists():
+            return
+        if not view["done"] and tab.get_yview()[1] > 0.9:
+            try:
+                loadPage()
+            except sqlite3.Error as e:
+                logging.error("Error retreiving past visitors: %s", e)
+                view["done"] = True
+        Vis.after(200, scrolled)
+
+    tk.Button(controls, text="Apply", command=apply).pack(side=tk.LEFT)
+    count.pack(side=tk.LEFT)
+    apply()
+    scrolled()
+
+
+def viewAnalytics(currentTop: tk.Toplevel | tk.Tk):
+    Vis = tk.Toplevel(currentTop)
+    Vis.title("Analytics")
+    controls = tk.Frame(Vis)
+    controls.grid(row=0, column=0, columnspan=3, sticky="we")
+    tk.Label(controls, text="From:").pack(side=tk.LEFT)
+    (startEntry := tk.Entry(controls, width=10)).pack(side=tk.LEFT)
+    tk.Label(controls, text="To:").pack(side=tk.LEFT)
+    (endEntry := tk.Entry(controls, width=10)).pack(side=tk.LEFT)
+    # Everything here reads the rollup tables, never PastVisitors itself
+    sheets = []
+    for column, heads in enumerate(
+        [
+            ["Day", "Signed In", "Signed Out", "Average Minutes"],
+            ["Hour", "Signed In", "Signed Out"],
+            ["Grade", "Late", "Left Early"],
+        ]
+    ):
+        tab = tk.Sheet(
+            Vis,
+            data=[],
+            auto_resize_columns=50,
+            width=int(110 * len(heads)),
+            height=400,
+        )
+        tab.enable_bindings("arrowkeys", "column_width_resize")
+        tab.set_header_data(heads)
+        tab.grid(row=1, column=column)
+        sheets.append(tab)
+
+    def apply():
+        try:
+            start = parseDateEntry(startEntry)
+            end = parseDateEntry(endEntry, nextDay=True)
+        except ValueError:
+            pymsgbox.alert("Dates need to look like 01/31/2024", "ERROR")
+            return
+        try:
+            data = [
+                KIOSK.dailyVisits(start, end),
+                [
+                    (f"{hour:02}:00", signIns, signOuts)
+                    for hour, signIns, signOuts in KIOSK.hourlyVisits(start, end)
+                ],
+                KIOSK.studentsByGrade(start, end),
+            ]
+        except sqlite3.Error as e:
+            logging.error("Error retreiving analytics: %s", e)
+            pymsgbox.alert("Error loading analytics. Please check the logs for more info.")
+            return
+        for tab, rows in zip(sheets, data):
+            tab.set_sheet_data([list(row) for row in rows])
+
+    def rebuild():
+        runWithProgress(
+            "Recounting visit history...",
+            KIOSK.rebuildAnalytics,
+            lambda _: apply() if Vis.winfo_exists() else None,
+        )
+
+    tk.Button(controls, text="Apply", command=apply).pack(side=tk.LEFT)
+    tk.Button(controls, text="Recount", command=rebuild).pack(side=tk.LEFT)
+    apply()
 
 
 def prepPrinter():
-    prepCommands = (
-        printer.INITALIZE + b"\x1c\x2e"  # Disable Chinese mode
-        b"\x1B\x61\x01"  # Center align text
-        + printer.SET_SIZE  # Prep set size
-        + driver.binComm(0b00000001)  # Set text to double size
-    )
     try:
-        driver.printIfConnected(prepCommands)
+        MONITOR.printIfConnected(printer.PREP)
     except FileNotFoundError:
         logging.critical("Printer not found for prep. Checking debug mode")
         if not DEBUG:
@@ -586,29 +988,83 @@ def prepPrinter():
         logging.critical("Weird exception. Race condition might have occured.")
 
 
-def testPrinter():
-    testCommand = b"\x1d\x28\x41\02\00\x00\x64"
-    try:
-        driver.printIfConnected(testCommand)
-    except FileNotFoundError:
+def testPrinterDone(job: printqueue.PrintJob):
+    if isinstance(job.error, FileNotFoundError):
         logging.critical("Printer not found for test.")
         pymsgbox.alert("Printer not found", "ERROR")
         return
-    except IOError:
+    if job.error is not None:
         logging.critical("Weird exception. Race condition might have occured.")
-    time.sleep(10)
-    prepPrinter()
+    # Give the self test time to finish before resetting the printer
+    window.after(10000, lambda: PRINTS.submit(printer.PREP))
+
+
+def printerChanged(connected: bool):
+    if connected:
+        # The printer forgets its settings when it loses power
+        PRINTS.submit(printer.PREP)
+    else:
+        logging.critical("Printer disconnected")
+
+
+def printerStatus():
+    return "Printer: connected" if MONITOR.connected else "Printer: NOT CONNECTED"
+
+
+def testPrinter():
+    testCommand = b"\x1d\x28\x41\02\00\x00\x64"
+    PRINTS.submit(testCommand, testPrinterDone)
 
 
 def customPrint():
     toPrint = pymsgbox.prompt("Text to print")
     toPrint = toPrint.replace("\\n", "\n")
-    try:
-        printer.simplePrint(toPrint)
-    except FileNotFoundError:
-        logging.critical("Printer not found")
-    except IOError:
-        logging.critical("Weird exception. Race condition might have occured.")
+    PRINTS.submit(printer.formatText(toPrint))
+
+
+def importRosterFile():
+    path = filedialog.askopenfilename(
+        title="Student roster", filetypes=[("CSV files", "*.csv"), ("All files", "*")]
+    )
+    if not path:
+        return
+
+    def work():
+        with open(path, newline="", encoding="utf-8-sig") as rosterFile:
+            return KIOSK.importRoster(rosterFile)
+
+    runWithProgress(
+        "Importing roster...",
+        work,
+        lambda count: pymsgbox.alert(f"Imported {count} students", "Roster"),
+    )
+
+
+def exportHistoryFile():
+    path = filedialog.asksaveasfilename(
+        title="Export past visitors",
+        defaultextension=".csv",
+        filetypes=[
+            ("CSV files", "*.csv"),
+            ("Compressed CSV files", "*.csv.gz"),
+            ("JSON Lines files", "*.jsonl"),
+        ],
+    )
+    if not path:
+        return
+    runWithProgress(
+        "Exporting past visitors...",
+        lambda: export.export(KIOSK, "past", path),
+        lambda count: pymsgbox.alert(f"Exported {count} visits", "Export"),
+    )
+
+
+def printQueueStatus():
+    stats = PRINTS.stats()
+    pymsgbox.alert(
+        "\n".join(f"{key.capitalize()}: {value}" for key, value in stats.items()),
+        "Print Queue",
+    )
 
 
 # noinspection SpellCheckingInspection
@@ -617,8 +1073,17 @@ def RUNadminconsole():
     adminconsole = tk.Toplevel()
     view = functools.partial(newViewCurrent, adminconsole)
     viewpas = functools.partial(viewPast, adminconsole)
+    viewStats = functools.partial(viewAnalytics, adminconsole)
     adminconsole.title("Admin Console")
     adminconsole.config(width=300, height=200)
+    status = tk.Label(adminconsole, text=printerStatus(), font=helv(21))
+    status.pack(fill=tk.BOTH, expand=True)
+
+    def refreshStatus():
+        status["text"] = printerStatus()
+        adminconsole.after(1000, refreshStatus)
+
+    adminconsole.after(1000, refreshStatus)
     tk.Button(
         adminconsole,
         text="Add New Admin",
@@ -640,6 +1105,20 @@ def RUNadminconsole():
         font=helv(21),
         command=viewpas,
     ).pack(fill=tk.BOTH, expand=True)
+    tk.Button(
+        adminconsole,
+        text="Analytics",
+        bg="orchid",
+        font=helv(21),
+        command=viewStats,
+    ).pack(fill=tk.BOTH, expand=True)
+    tk.Button(
+        adminconsole,
+        text="Sign Out Everyone",
+        bg="purple",
+        font=helv(21),
+        command=signoutall,
+    ).pack(fill=tk.BOTH, expand=True)
     tk.Button(
         adminconsole,
         text="Test Printer",
@@ -654,6 +1133,27 @@ def RUNadminconsole():
         font=helv(21),
         command=customPrint,
     ).pack(fill=tk.BOTH, expand=True)
+    tk.Button(
+        adminconsole,
+        text="Print Queue",
+        bg="gray",
+        font=helv(21),
+        command=printQueueStatus,
+    ).pack(fill=tk.BOTH, expand=True)
+    tk.Button(
+        adminconsole,
+        text="Import Student Roster",
+        bg="cyan",
+        font=helv(21),
+        command=importRosterFile,
+    ).pack(fill=tk.BOTH, expand=True)
+    tk.Button(
+        adminconsole,
+        text="Export Past Visitors",
+        bg="khaki",
+        font=helv(21),
+        command=exportHistoryFile,
+    ).pack(fill=tk.BOTH, expand=True)
     adminconsole.focus()
     adminconsole.grab_set()
     return
@@ -669,17 +1169,20 @@ def passenter():
         pashash := pymsgbox.password("Password", "IDENTIFY YOURSELF", timeout=60000)
     ):
         return
-    if username in ADMINS:
-        if bcrypt.checkpw(pashash.encode(), ADMINS[username].encode()):
-            logging.info(f"Admin {username} logged in")
-            RUNadminconsole()
-            return
-        else:
-            pymsgbox.alert("Incorrect Password", "ERROR")
-            return
+    # The kiosk (or server) decides, since ADMINS misses admins added elsewhere
+    runWithProgress(
+        "Checking password...",
+        functools.partial(KIOSK.checkLogin, username, pashash),
+        functools.partial(loginDone, username),
+    )
+
+
+def loginDone(username: str, loggedIn: bool):
+    if loggedIn:
+        logging.info("Admin %s logged in", username)
+        RUNadminconsole()
     else:
-        pymsgbox.alert("User Not Found", "ERROR")
-        return
+        pymsgbox.alert("Incorrect username or password", "ERROR")
 
 
 # noinspection SpellCheckingInspection
@@ -708,20 +1211,36 @@ def main():
 
 
 if __name__ == "__main__":
-    if driver.isPrinterConnected():
+    logconfig.setupLogging()
+    if "--test-run" in sys.argv:
+        testRun()
+    atexit.register(db.closeAll)
+    try:
+        if client.serverUrl() is None:
+            migrations.migrate()
+    except sqlite3.Error as e:
+        logging.critical("Migrating the database failed: %s", e)
+    setupKiosk()
+    # Anything the last run journaled but didn't get into the database
+    recoverJournal()
+    setupWindow()
+    MONITOR.start()
+    MONITOR.attach(window)
+    MONITOR.addListener(printerChanged)
+    if MONITOR.connected:
         try:
             prepPrinter()
         except FileNotFoundError:
-            while True:
-                pymsgbox.alert("Printer is not found, please talk to Ms.Linda")
-        main()
-        window.mainloop()
+            logging.critical("Printer went away during prep")
     elif DEBUG:
         logging.warning("No printer found but debug mode is on, continuing anyway")
         pymsgbox.alert("No Printer Found but debug mode is on\nContinuing anyway")
-        main()
-        window.mainloop()
     else:
+        # Keep running; the monitor preps the printer when it is plugged back in
         logging.critical("Printer not found")
-        while True:
-            pymsgbox.alert("Printer is not found, please talk to Ms.Linda")
+        pymsgbox.alert("Printer is not found, please talk to Ms.Linda")
+    main()
+    window.after_idle(startBackgroundLoading)
+    window.after(RECOVER_MS, scheduleRecovery)
+    window.after_idle(scheduleArchiving)
+    window.mainloop()
@@ -0,0 +1,195 @@
+#!/bin/env python3
+"""Versioned schema migrations for data.db.
+
+The schema version lives in PRAGMA user_version. Each migration runs in its own
+transaction and bumps the version when it commits, so a migration that fails
+part way leaves the database at the previous version.
+
+Run `python migrations.py [database]` to bring a database up to date."""
+import datetime
+import logging
+import sys
+
+import database
+
+
+def parseEpoch(readableTime, readableDate):
+    """Converts the old "%I:%M:%S %p" / "%m/%d/%Y" strings to a local epoch"""
+    try:
+        return int(
+            datetime.datetime.strptime(
+                f"{readableDate} {readableTime}", "%m/%d/%Y %I:%M:%S %p"
+            ).timestamp()
+        )
+    except (TypeError, ValueError):
+        return None
+
+
+def _addEpochColumns(conn):
+    conn.create_function("parseEpoch", 2, parseEpoch, deterministic=True)
+    conn.execute("ALTER TABLE Visitors ADD COLUMN EpochIn INTEGER")
+    conn.execute("ALTER TABLE PastVisitors ADD COLUMN EpochIn INTEGER")
+    conn.execute("ALTER TABLE PastVisitors ADD COLUMN EpochOut INTEGER")
+    conn.execute("UPDATE Visitors SET EpochIn = parseEpoch(TimeIn, DateIn)")
+    conn.execute(
+        """UPDATE PastVisitors SET EpochIn = parseEpoch(TimeIn, DateIn),
+        EpochOut = parseEpoch(TimeOut, DateOut)"""
+    )
+    conn.execute("CREATE INDEX Visitors_Name ON Visitors (LastName, FirstName)")
+    conn.execute("CREATE INDEX Visitors_EpochIn ON Visitors (EpochIn)")
+    conn.execute("CREATE INDEX PastVisitors_Name ON PastVisitors (LastName, FirstName)")
+    conn.execute("CREATE INDEX PastVisitors_EpochIn ON PastVisitors (EpochIn)")
+    conn.execute("CREATE INDEX PastVisitors_EpochOut ON PastVisitors (EpochOut)")
+
+
+def _addSettings(conn):
+    conn.execute(
+        """CREATE TABLE Settings (
+        "Key" TEXT NOT NULL PRIMARY KEY,
+        "Value" TEXT NOT NULL
+        )"""
+    )
+
+
+def _addBadgeTokens(conn):
+    # The secret half of each visit's badge; the Id is the other half
+    conn.execute("ALTER TABLE Visitors ADD COLUMN Token TEXT")
+
+
+def _addStudentEvents(conn):
+    conn.execute(
+        """CREATE TABLE StudentEvents (
+        "Id" INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+        "FirstName" TEXT NOT NULL,
+        "LastName" TEXT NOT NULL,
+        "Grade" INTEGER NOT NULL,
+        "Type" TEXT NOT NULL CHECK ("Type" IN ('late', 'early')),
+        "Epoch" INTEGER NOT NULL
+        )"""
+    )
+    conn.execute("CREATE INDEX StudentEvents_Epoch ON StudentEvents (Epoch)")
+    conn.execute("CREATE INDEX StudentEvents_Grade ON StudentEvents (Grade, Epoch)")
+    conn.execute("CREATE INDEX StudentEvents_Name ON StudentEvents (LastName, FirstName)")
+
+
+def _addStudents(conn):
+    # StudentId is the school's id, or "last, first" when the roster has none
+    conn.execute(
+        """CREATE TABLE Students (
+        "Id" INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+        "StudentId" TEXT NOT NULL UNIQUE,
+        "FirstName" TEXT NOT NULL,
+        "LastName" TEXT NOT NULL,
+        "Grade" INTEGER NOT NULL
+        )"""
+    )
+    conn.execute("CREATE INDEX Students_Grade ON Students (Grade, LastName, FirstName)")
+
+
+def _addJournalApplied(conn):
+    # Journal records already in the database, so replaying one is a no-op
+    conn.execute(
+        """CREATE TABLE JournalApplied (
+        "Key" TEXT NOT NULL PRIMARY KEY,
+        "Result" INTEGER,
+        "Epoch" INTEGER NOT NULL
+        )"""
+    )
+    conn.execute("CREATE INDEX JournalApplied_Epoch ON JournalApplied (Epoch)")
+
+
+def _addRollups(conn):
+    # Triggers keep these up to date in the same transaction as the insert
+    # that changes them, however the row gets there. Day and Hour are local.
+    conn.execute(
+        """CREATE TABLE VisitRollups (
+        "Day" TEXT NOT NULL,
+        "Hour" INTEGER NOT NULL,
+        "SignIns" INTEGER NOT NULL DEFAULT 0,
+        "SignOuts" INTEGER NOT NULL DEFAULT 0,
+        "Seconds" INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY ("Day", "Hour")
+        ) WITHOUT ROWID"""
+    )
+    conn.execute(
+        """CREATE TABLE StudentRollups (
+        "Day" TEXT NOT NULL,
+        "Grade" INTEGER NOT NULL,
+        "Type" TEXT NOT NULL,
+        "Count" INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY ("Day", "Grade", "Type")
+        ) WITHOUT ROWID"""
+    )
+    conn.execute(
+        """CREATE TRIGGER Visitors_Rollup AFTER INSERT ON Visitors
+        WHEN NEW.EpochIn IS NOT NULL BEGIN
+            INSERT INTO VisitRollups (Day, Hour, SignIns) VALUES (
+                date(NEW.EpochIn, 'unixepoch', 'localtime'),
+                CAST(strftime('%H', NEW.EpochIn, 'unixepoch', 'localtime') AS INTEGER),
+                1
+            ) ON CONFLICT (Day, Hour) DO UPDATE SET SignIns = SignIns + 1;
+        END"""
+    )
+    conn.execute(
+        """CREATE TRIGGER PastVisitors_Rollup AFTER INSERT ON PastVisitors
+        WHEN NEW.EpochIn IS NOT NULL AND NEW.EpochOut IS NOT NULL BEGIN
+            INSERT INTO VisitRollups (Day, Hour, SignOuts, Seconds) VALUES (
+                date(NEW.EpochOut, 'unixepoch', 'localtime'),
+                CAST(strftime('%H', NEW.EpochOut, 'unixepoch', 'localtime') AS INTEGER),
+                1,
+                MAX(NEW.EpochOut - NEW.EpochIn, 0)
+            ) ON CONFLICT (Day, Hour) DO UPDATE SET SignOuts = SignOuts + 1,
+                Seconds = Seconds + excluded.Seconds;
+        END"""
+    )
+    conn.execute(
+        """CREATE TRIGGER StudentEvents_Rollup AFTER INSERT ON StudentEvents BEGIN
+            INSERT INTO StudentRollups (Day, Grade, Type, Count) VALUES (
+                date(NEW.Epoch, 'unixepoch', 'localtime'), NEW.Grade, NEW.Type, 1
+            ) ON CONFLICT (Day, Grade, Type) DO UPDATE SET Count = Count + 1;
+        END"""
+    )
+
+
+def _addJournalAppliedDetail(conn):
+    # The names a sign out signed out, as JSON, for a replay to return again
+    conn.execute('ALTER TABLE JournalApplied ADD COLUMN "Detail" TEXT')
+
+
+# Append only. The position in this list is the schema version it migrates to.
+MIGRATIONS = [
+    ("Add epoch columns and name/time indexes", _addEpochColumns),
+    ("Add Settings table", _addSettings),
+    ("Add visitor badge tokens", _addBadgeTokens),
+    ("Add StudentEvents table", _addStudentEvents),
+    ("Add Students roster table", _addStudents),
+    ("Add JournalApplied table", _addJournalApplied),
+    ("Add analytics rollup tables", _addRollups),
+    ("Add JournalApplied.Detail for sign outs", _addJournalAppliedDetail),
+]
+
+
+def getVersion(path="data.db"):
+    return database.getDatabase(path).execute("PRAGMA user_version", fetch=1)[0]
+
+
+def migrate(path="data.db"):
+    """Applies every pending migration and returns the new schema version"""
+    db = database.getDatabase(path)
+    version = getVersion(path)
+    for number, (description, func) in enumerate(MIGRATIONS, start=1):
+        if number <= version:
+            continue
+        logging.warning("Migrating %s to version %s: %s", path, number, description)
+        with db.transaction() as conn:
+            func(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+        version = number
+    return version
+
+
+if __name__ == "__main__":
+    target = sys.argv[1] if len(sys.argv) > 1 else "data.db"
+    before = getVersion(target)
+    after = migrate(target)
+    print(f"{target}: schema version {before} -> {after}")
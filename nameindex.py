@@ -0,0 +1,154 @@
+"""An in-memory index of names for finding people as they're typed.
+
+Names are found three ways, best first: by prefix (a trie over each word of
+the name, so "jo sm" finds John Smith), by trigrams (so "jhon smith" still
+finds him) and by Soundex (so "smyth" does too). Every entry has a key, the
+visit Id for visitors, so people with the same name stay separate."""
+import collections
+import re
+
+# Soundex digits; vowels, h, w and y have none
+_SOUNDS = {
+    **dict.fromkeys("bfpv", "1"),
+    **dict.fromkeys("cgjkqsxz", "2"),
+    **dict.fromkeys("dt", "3"),
+    "l": "4",
+    **dict.fromkeys("mn", "5"),
+    "r": "6",
+}
+MIN_SIMILARITY = 0.3
+
+
+def words(name: str):
+    return re.findall(r"[a-z0-9']+", name.lower())
+
+
+def soundex(word: str):
+    """The four character Soundex code of a word, like "S530" for Smith"""
+    word = "".join(c for c in word.lower() if c.isalpha())
+    if not word:
+        return ""
+    code = word[0].upper()
+    last = _SOUNDS.get(word[0])
+    for c in word[1:]:
+        digit = _SOUNDS.get(c)
+        if digit and digit != last:
+            code += digit
+            if len(code) == 4:
+                break
+        # h and w don't separate letters with the same code, vowels do
+        if c not in "hw":
+            last = digit
+    return code.ljust(4, "0")
+
+
+def trigrams(text: str):
+    text = f"  {' '.join(words(text))} "
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+class NameIndex:
+    def __init__(self):
+        self.names = {}
+        # key -> (name's words joined by spaces, its number of trigrams)
+        self._normal = {}
+        self._trie = {}
+        self._grams = collections.defaultdict(set)
+        self._sounds = collections.defaultdict(set)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, key):
+        return key in self.names
+
+    def add(self, key, name: str):
+        if key in self.names:
+            self.remove(key)
+        self.names[key] = name
+        grams = trigrams(name)
+        self._normal[key] = (" ".join(words(name)), len(grams))
+        for word in words(name):
+            node = self._trie
+            for c in word:
+                node = node.setdefault(c, {})
+                node.setdefault("", set()).add(key)
+            self._sounds[soundex(word)].add(key)
+        for gram in grams:
+            self._grams[gram].add(key)
+
+    def remove(self, key):
+        name = self.names.pop(key, None)
+        if name is None:
+            return
+        del self._normal[key]
+        for word in words(name):
+            self._unindex(self._trie, word, key)
+            self._discard(self._sounds, soundex(word), key)
+        for gram in trigrams(name):
+            self._discard(self._grams, gram, key)
+
+    def _unindex(self, node, word, key):
+        # Returns whether node is empty afterwards, so parents can prune it
+        if word:
+            child = node.get(word[0])
+            if child is not None and self._unindex(child, word[1:], key):
+                del node[word[0]]
+        if node is not self._trie:
+            keys = node.get("")
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del node[""]
+        return not node
+
+    @staticmethod
+    def _discard(postings, value, key):
+        keys = postings.get(value)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del postings[value]
+
+    def _prefixed(self, word):
+        node = self._trie
+        for c in word:
+            node = node.get(c)
+            if node is None:
+                return set()
+        return node.get("", set())
+
+    def search(self, query: str, limit=10):
+        """Keys of the names most like query, best first.
+
+        Exact names come first, then names with a word starting with each word
+        of the query, then names that are spelled or sound about the same."""
+        queryWords = words(query)
+        if not queryWords:
+            return []
+        scores = collections.defaultdict(float)
+
+        prefixed = set.intersection(*(self._prefixed(word) for word in queryWords))
+        for key in prefixed:
+            scores[key] += 2
+
+        grams = trigrams(query)
+        shared = collections.Counter()
+        for gram in grams:
+            shared.update(self._grams.get(gram, ()))
+        for key, count in shared.items():
+            # Jaccard similarity of the two sets of trigrams
+            similarity = count / (len(grams) + self._normal[key][1] - count)
+            if similarity >= MIN_SIMILARITY or key in prefixed:
+                scores[key] += similarity
+
+        for word in queryWords:
+            for key in self._sounds.get(soundex(word), ()):
+                scores[key] += 0.5 / len(queryWords)
+
+        wanted = " ".join(queryWords)
+        for key in scores:
+            if self._normal[key][0] == wanted:
+                scores[key] += 3
+        ranked = sorted(scores, key=lambda key: (-scores[key], key))
+        return ranked[:limit]
@@ -2,15 +2,184 @@
 
 import os
 import datetime, time
+import string
 import sys
+import unicodedata
 
 import driver
 from driver import printIfConnected
 
+# Command Reference: https://reference.epson-biz.com/modules/ref_escpos/index.php?content_id=72#commands
+# Backup: http://web.archive.org/web/20240208194111/https://reference.epson-biz.com/modules/popup/index.php/termsofuse_reference/index.php?m=ref_escpos&cid=72&PHPSESSID=be1f982d549616f05fa773f11fe980ab#commands
 LF = b"\x0A"
 CF = "\n".encode("ascii")
 INITALIZE = b"\x1B\x40"
 SET_SIZE = b"\x1d\x21"
+BOLD = b"\x1B\x45"
+ALIGN = b"\x1B\x61"
+FEED = b"\x1B\x64"
+CUT = b"\x1B\x64\x02"  # Cut paper (partial cut)
+BARCODE_HEIGHT = b"\x1d\x68"
+BARCODE_WIDTH = b"\x1d\x77"
+BARCODE_HRI = b"\x1d\x48"  # Where the human readable text goes
+BARCODE = b"\x1d\x6b"
+CODE128 = 73
+QR = b"\x1d\x28\x6b"
+DISABLE_CHINESE = b"\x1c\x2e"
+
+LEFT, CENTER, RIGHT = 0, 1, 2
+
+# Characters NFKD can't break down to ASCII on its own
+_TRANSLITERATIONS = str.maketrans(
+    {
+        "ß": "ss",
+        "æ": "ae",
+        "Æ": "AE",
+        "ø": "o",
+        "Ø": "O",
+        "ł": "l",
+        "Ł": "L",
+        "đ": "d",
+        "Đ": "D",
+        "‘": "'",
+        "’": "'",
+        "“": '"',
+        "”": '"',
+        "–": "-",
+        "—": "-",
+    }
+)
+
+
+def encodeText(text: str):
+    """Encodes text for the printer, turning accented letters into plain ASCII
+    ("José" prints as "Jose") and anything else it can't print into "?" """
+    if text.isascii():
+        return text.encode("ascii")
+    text = unicodedata.normalize("NFKD", text.translate(_TRANSLITERATIONS))
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return text.encode("ascii", "replace")
+
+
+class EscPos:
+    """Builds a string of ESC/POS commands, e.g.
+    `EscPos().align(CENTER).bold().text("LATE").bold(False).build()`"""
+
+    def __init__(self):
+        self._data = bytearray()
+
+    def raw(self, data: bytes):
+        self._data += data
+        return self
+
+    def init(self):
+        return self.raw(INITALIZE)
+
+    def text(self, text: str):
+        return self.raw(encodeText(text))
+
+    def line(self, text: str = ""):
+        return self.text(text).raw(LF)
+
+    def bold(self, on=True):
+        return self.raw(BOLD + bytes([on]))
+
+    def align(self, alignment: int):
+        return self.raw(ALIGN + bytes([alignment]))
+
+    def size(self, width=1, height=1):
+        """Character size as a multiple of normal, 1 to 8 each way"""
+        return self.raw(SET_SIZE + bytes([(width - 1) << 4 | (height - 1)]))
+
+    def feed(self, lines: int):
+        return self.raw(LF * lines)
+
+    def cut(self):
+        return self.raw(CUT)
+
+    def code128(self, data: str, height=80, width=2):
+        """A Code128 barcode (code set B) with the text printed under it"""
+        data = b"{B" + data.encode("ascii")
+        return (
+            self.raw(BARCODE_HEIGHT + bytes([height]))
+            .raw(BARCODE_WIDTH + bytes([width]))
+            .raw(BARCODE_HRI + b"\x02")
+            .raw(BARCODE + bytes([CODE128, len(data)]) + data)
+        )
+
+    def qr(self, data: str, size=6):
+        """A model 2 QR code with low error correction, size 1 to 16 dots a module"""
+        data = data.encode("ascii")
+        store = len(data) + 3
+        return (
+            self.raw(QR + b"\x04\x00\x31\x41\x32\x00")
+            .raw(QR + b"\x03\x00\x31\x43" + bytes([size]))
+            .raw(QR + b"\x03\x00\x31\x45\x30")
+            .raw(QR + bytes([store & 0xFF, store >> 8]) + b"\x31\x50\x30" + data)
+            .raw(QR + b"\x03\x00\x31\x51\x30")
+        )
+
+    def build(self):
+        return bytes(self._data)
+
+
+class SlipTemplate:
+    """A slip compiled once from a format string like "Name: {name}".
+
+    The text between fields is encoded up front and joined with the static
+    prefix and suffix, so rendering a slip only encodes the fields."""
+
+    def __init__(self, template: str, prefix: bytes = b"", suffix: bytes = b""):
+        self._parts = []
+        self._fields = []
+        literal = bytearray(prefix)
+        for text, field, _, _ in string.Formatter().parse(template):
+            literal += encodeText(text)
+            if field is None:
+                continue
+            self._parts.append(bytes(literal))
+            self._fields.append(field)
+            literal = bytearray()
+        literal += suffix
+        self._parts.append(bytes(literal))
+
+    def render(self, **fields):
+        parts = self._parts
+        out = [parts[0]]
+        for i, name in enumerate(self._fields, start=1):
+            value = fields[name]
+            out.append(value if isinstance(value, bytes) else encodeText(value))
+            out.append(parts[i])
+        return b"".join(out)
+
+
+# Formatted text and line feed, space to make it easy to tear, then cut
+SLIP_END = EscPos().raw(LF).feed(10).cut().build()
+PREP = (
+    EscPos()
+    .init()
+    .raw(DISABLE_CHINESE)
+    .align(CENTER)
+    .size(1, 2)  # Set text to double size
+    .build()
+)
+LATE_SLIP = SlipTemplate(
+    "LATE SLIP\nName: {name}\nTime: {time}\nDate: {date}", suffix=SLIP_END
+)
+VISITOR_SLIP = SlipTemplate(
+    "VISITOR:\nName: {name}\nTime: {time}\nDate: {date}{badge}", suffix=SLIP_END
+)
+
+_clock = (None, b"", b"")
+
+
+def _clockBytes():
+    """The encoded time and date, only reformatted when the minute changes"""
+    global _clock
+    minute = int(time.time() // 60)
+    if _clock[0] != minute:
+        _clock = (minute, get_time().encode("ascii"), get_date().encode("ascii"))
+    return _clock[1], _clock[2]
 
 
 # Function to get the current date in mm/dd/yyyy format
@@ -24,28 +193,34 @@ def get_time():
     return datetime.datetime.now().strftime("%I:%M %p")
 
 
+def formatText(text):
+    return encodeText(text) + SLIP_END
+
+
+def lateSlip(name):
+    now, today = _clockBytes()
+    return LATE_SLIP.render(name=name, time=now, date=today)
+
+
+def badgeBarcode(token: str):
+    """The barcode a visitor scans to sign out, on its own line"""
+    return EscPos().raw(LF).code128(token).build()
+
+
+def visitorSlip(name, token=None):
+    now, today = _clockBytes()
+    badge = badgeBarcode(token) if token else b""
+    return VISITOR_SLIP.render(name=name, time=now, date=today, badge=badge)
+
+
 def simplePrint(text):
-    finaltext = text.encode("ascii").replace(CF, LF)
-    # Command Reference: https://reference.epson-biz.com/modules/ref_escpos/index.php?content_id=72#commands
-    # Backup: http://web.archive.org/web/20240208194111/https://reference.epson-biz.com/modules/popup/index.php/termsofuse_reference/index.php?m=ref_escpos&cid=72&PHPSESSID=be1f982d549616f05fa773f11fe980ab#commands
-    # ESC/POS commands for initializing printer, centering text, and cutting paper
-    esc_pos_commands = (
-        finaltext
-        + b"\x0A"  # Formatted text and line feed
-        + (LF * 10)  # Space to make it easy to tear
-        + b"\x1B\x64\x02"  # Cut paper (partial cut)
-    )
     # Send ESC/POS commands directly to /dev/lp0 (thermal printer)
-    printIfConnected(esc_pos_commands)
+    printIfConnected(formatText(text))
 
 
 def printlate(name):
-    # Formatted text to be printed
-    formatted_text = f"LATE SLIP\nName: {name}\nTime: {get_time()}\nDate: {get_date()}"
-    simplePrint(formatted_text)
+    printIfConnected(lateSlip(name))
 
 
 def printvisitor(name):
-    # Formatted text to be printed
-    formatted_text = f"VISITOR:\nName: {name}\nTime: {get_time()}\nDate: {get_date()}"
-    simplePrint(formatted_text)
+    printIfConnected(visitorSlip(name))
@@ -0,0 +1,124 @@
+#!/bin/python
+"""Privileged print daemon.
+
+Holds the printer device open and takes ESC/POS jobs from driver.sendCommand
+over a Unix socket, so printing a slip doesn't start two interpreters and sudo.
+Run it as root: `sudo python printerd.py [device] [socket]`
+
+It runs as root, so it imports nothing from the kiosk's own files (which the
+kiosk user can edit). The protocol constants are copied from driver.py and
+have to be kept in step with it."""
+import logging
+import os
+import socket
+import socketserver
+import struct
+import sys
+import threading
+
+DEVICE = "/dev/usb/lp0"
+SOCKET = os.environ.get("PRINTERD_SOCKET", "/run/printerd.sock")
+# The same framing as driver.py: the device path is sent to each client as it
+# connects, then each job is a 4 byte big-endian length then the job,
+# answered with one status byte
+FRAME = struct.Struct(">I")
+MAX_JOB = 1 << 20
+STATUS_OK = 0
+STATUS_NOT_FOUND = 1
+STATUS_IO_ERROR = 2
+
+
+def recvExactly(sock: socket.socket, size: int):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("printerd connection closed")
+        data += chunk
+    return bytes(data)
+
+
+class Device:
+    """The printer device, kept open between jobs"""
+
+    def __init__(self, path=DEVICE):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    def write(self, data: bytes):
+        """Returns one of the STATUS_ codes"""
+        with self._lock:
+            try:
+                if self._file is None:
+                    # Don't create a regular file where a device node should be
+                    if not os.path.exists(self.path):
+                        return STATUS_NOT_FOUND
+                    self._file = open(self.path, "ab", buffering=0)
+                self._file.write(data)
+                return STATUS_OK
+            except OSError as e:
+                self._close()
+                if not os.path.exists(self.path):
+                    return STATUS_NOT_FOUND
+                logging.error("Writing to %s failed: %s", self.path, e)
+                return STATUS_IO_ERROR
+
+    def _close(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        # So a kiosk set up for another device prints some other way
+        device = self.server.printer.path.encode()
+        self.request.sendall(FRAME.pack(len(device)) + device)
+        while True:
+            try:
+                (size,) = FRAME.unpack(recvExactly(self.request, FRAME.size))
+                if size > MAX_JOB:
+                    logging.error("Refusing %s byte job", size)
+                    return
+                data = recvExactly(self.request, size)
+            except ConnectionError:
+                return
+            self.request.sendall(bytes([self.server.printer.write(data)]))
+
+
+class PrinterServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path=SOCKET, device=DEVICE):
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, JobHandler)
+        # The kiosk runs as a normal user
+        os.chmod(path, 0o666)
+        self.printer = Device(device)
+
+    def server_close(self):
+        super().server_close()
+        self.printer.close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    device = sys.argv[1] if len(sys.argv) > 1 else DEVICE
+    path = sys.argv[2] if len(sys.argv) > 2 else SOCKET
+    with PrinterServer(path, device) as server:
+        logging.info("Serving %s on %s", device, path)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,110 @@
+import logging
+import queue
+import threading
+
+import driver
+
+INTERVAL = 1.0  # seconds between polls right after the state changes
+MAX_INTERVAL = 10.0  # polls back off to this while nothing changes
+POLL_MS = 100
+
+
+class PrinterMonitor:
+    """Watches the printer from a background thread and caches whether it's connected.
+
+    `connected` is always the last known state, so checking it never touches
+    the filesystem. Listeners added with addListener are called with True or
+    False whenever the state changes; once attached to a Tk window they run on
+    the Tk thread."""
+
+    def __init__(self, interval=INTERVAL, maxInterval=MAX_INTERVAL):
+        self.interval = interval
+        self.maxInterval = maxInterval
+        self.connected = False
+        self._listeners = []
+        self._events = queue.Queue()
+        self._window = None
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        self.connected = self._poll()
+        self._thread = threading.Thread(target=self._run, name="printermonitor", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def attach(self, window):
+        """Runs listeners on window's thread from now on"""
+        self._window = window
+        window.after(POLL_MS, self._drain)
+
+    def addListener(self, callback):
+        self._listeners.append(callback)
+
+    def check(self):
+        """Asks the monitor thread to poll now instead of waiting out its backoff"""
+        self._wake.set()
+
+    def printIfConnected(self, commands: bytes):
+        """driver.printIfConnected, but using the cached state instead of a fresh check"""
+        if not self.connected:
+            raise FileNotFoundError("Printer Not Found")
+        try:
+            driver.sendCommand(commands)
+        except FileNotFoundError:
+            self._setState(False)
+            raise
+
+    def _poll(self):
+        try:
+            return driver.isPrinterConnected()
+        except Exception as e:
+            logging.error("Checking the printer failed: %s", e)
+            return False
+
+    def _run(self):
+        interval = self.interval
+        while not self._stopped.is_set():
+            self._wake.wait(interval)
+            self._wake.clear()
+            if self._stopped.is_set():
+                break
+            if self._setState(self._poll()):
+                interval = self.interval
+            else:
+                interval = min(interval * 2, self.maxInterval)
+
+    def _setState(self, connected: bool):
+        with self._lock:
+            if connected == self.connected:
+                return False
+            self.connected = connected
+        logging.warning("Printer %s", "connected" if connected else "disconnected")
+        if self._window is None:
+            self._notify(connected)
+        else:
+            self._events.put(connected)
+        return True
+
+    def _notify(self, connected: bool):
+        for callback in self._listeners:
+            try:
+                callback(connected)
+            except Exception as e:
+                logging.error("Printer listener failed: %s", e)
+
+    def _drain(self):
+        while True:
+            try:
+                self._notify(self._events.get_nowait())
+            except queue.Empty:
+                break
+        self._window.after(POLL_MS, self._drain)
@@ -0,0 +1,130 @@
+import itertools
+import logging
+import queue
+import threading
+import time
+
+import driver
+
+RETRIES = 3
+BACKOFF = 0.5  # seconds before the first retry, doubled after each one
+POLL_MS = 50
+
+
+class PrintJob:
+    def __init__(self, jobId, commands: bytes, callback=None):
+        self.id = jobId
+        self.commands = commands
+        self.callback = callback
+        self.attempts = 0
+        self.error = None
+        self.submitted = time.monotonic()
+        self.finished = None
+
+
+class PrintQueue:
+    """Sends print jobs from a worker thread so the UI never waits on the printer.
+
+    `submit` returns a job id straight away. When the job finishes its callback
+    is called with the job; job.error is None if it printed. If the queue is
+    attached to a Tk window the callbacks run on the Tk thread via `after()`,
+    otherwise they run on the worker thread."""
+
+    def __init__(self, send=driver.printIfConnected, retries=RETRIES, backoff=BACKOFF):
+        self.send = send
+        self.retries = retries
+        self.backoff = backoff
+        self._jobs = queue.Queue()
+        self._done = queue.Queue()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._window = None
+        self._current = None
+        self.counts = {"submitted": 0, "printed": 0, "failed": 0, "retried": 0}
+        self._worker = threading.Thread(target=self._run, name="printqueue", daemon=True)
+        self._worker.start()
+
+    def attach(self, window):
+        """Runs completion callbacks on window's thread from now on"""
+        self._window = window
+        window.after(POLL_MS, self._drain)
+
+    def submit(self, commands: bytes, callback=None):
+        job = PrintJob(next(self._ids), commands, callback)
+        with self._lock:
+            self.counts["submitted"] += 1
+        logging.debug("Queued print job %s (%s bytes)", job.id, len(commands))
+        self._jobs.put(job)
+        return job.id
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self.counts,
+                depth=self._jobs.qsize() + (self._current is not None),
+            )
+
+    def join(self):
+        """Blocks until every submitted job has finished"""
+        self._jobs.join()
+
+    def stop(self):
+        self._jobs.put(None)
+        self._worker.join()
+
+    def _run(self):
+        while (job := self._jobs.get()) is not None:
+            self._current = job
+            try:
+                self._print(job)
+            finally:
+                self._current = None
+                self._jobs.task_done()
+        self._jobs.task_done()
+
+    def _print(self, job: PrintJob):
+        delay = self.backoff
+        while True:
+            job.attempts += 1
+            try:
+                self.send(job.commands)
+            except FileNotFoundError as e:
+                # No printer; retrying won't plug it back in
+                job.error = e
+            except IOError as e:
+                if job.attempts <= self.retries:
+                    logging.warning(
+                        "Print job %s failed (%s), retrying in %ss", job.id, e, delay
+                    )
+                    with self._lock:
+                        self.counts["retried"] += 1
+                    time.sleep(delay)
+                    delay *= 2
+                    continue
+                job.error = e
+            break
+        job.finished = time.monotonic()
+        with self._lock:
+            self.counts["failed" if job.error else "printed"] += 1
+        if job.error:
+            logging.critical("Print job %s failed: %s", job.id, job.error)
+        if job.callback is None:
+            return
+        if self._window is None:
+            self._callback(job)
+        else:
+            self._done.put(job)
+
+    def _callback(self, job):
+        try:
+            job.callback(job)
+        except Exception as e:
+            logging.error("Print job %s callback failed: %s", job.id, e)
+
+    def _drain(self):
+        while True:
+            try:
+                self._callback(self._done.get_nowait())
+            except queue.Empty:
+                break
+        self._window.after(POLL_MS, self._drain)
@@ -0,0 +1,166 @@
+#!/bin/env python3
+"""The student roster: importing it from CSV and suggesting names from it.
+
+The CSV needs a header row with first name, last name and grade columns, and
+may have a student id column. Re-importing updates students already there
+(matched by id, or by name without one) rather than adding them twice.
+
+Run `python roster.py students.csv [database]` to import one."""
+import bisect
+import csv
+import logging
+import sys
+
+import database
+import migrations
+
+CHUNK = 500
+# Header spellings we accept for each column, compared lowercased without spaces
+COLUMNS = {
+    "first": {"first", "firstname", "first_name", "givenname"},
+    "last": {"last", "lastname", "last_name", "surname", "familyname"},
+    "grade": {"grade", "gradelevel", "grade_level"},
+    "id": {"id", "studentid", "student_id", "studentnumber", "number"},
+}
+UPSERT = """INSERT INTO Students (StudentId, FirstName, LastName, Grade) VALUES (?, ?, ?, ?)
+ON CONFLICT (StudentId) DO UPDATE SET FirstName = excluded.FirstName,
+LastName = excluded.LastName, Grade = excluded.Grade"""
+
+
+def _columns(header):
+    found = {}
+    for column, name in enumerate(header):
+        name = name.strip().lower().replace(" ", "")
+        for field, spellings in COLUMNS.items():
+            if name in spellings and field not in found:
+                found[field] = column
+    missing = {"first", "last", "grade"} - found.keys()
+    if missing:
+        raise ValueError(f"Roster has no {', '.join(sorted(missing))} column")
+    return found
+
+
+def readRoster(lines):
+    """Yields (StudentId, FirstName, LastName, Grade) rows from CSV lines one at
+    a time, logging and skipping rows that don't make sense"""
+    reader = csv.reader(lines)
+    columns = _columns(next(reader, []))
+    for row in reader:
+        if not any(row):
+            continue
+        try:
+            first = row[columns["first"]].strip().capitalize()
+            last = row[columns["last"]].strip().capitalize()
+            grade = int(row[columns["grade"]])
+            studentId = row[columns["id"]].strip() if "id" in columns else ""
+        except (IndexError, ValueError):
+            logging.warning("Skipping roster line %s: %s", reader.line_num, row)
+            continue
+        if not (first and last and 1 <= grade <= 12):
+            logging.warning("Skipping roster line %s: %s", reader.line_num, row)
+            continue
+        yield studentId or f"{last.lower()}, {first.lower()}", first, last, grade
+
+
+def importRoster(lines, path="data.db", chunk=CHUNK):
+    """Upserts every student in a CSV file and returns how many there were.
+
+    Rows are written `chunk` at a time with executemany, each chunk in its own
+    transaction, so a big roster never holds the write lock for long."""
+    db = database.getDatabase(path)
+    count = 0
+    batch = []
+    for row in readRoster(lines):
+        batch.append(row)
+        if len(batch) >= chunk:
+            with db.transaction() as conn:
+                conn.executemany(UPSERT, batch)
+            count += len(batch)
+            batch.clear()
+    if batch:
+        with db.transaction() as conn:
+            conn.executemany(UPSERT, batch)
+        count += len(batch)
+    logging.warning("Imported %s students from the roster", count)
+    return count
+
+
+class RosterIndex:
+    """Students sorted by first and by last name, for typeahead.
+
+    Finding everyone whose name starts with a prefix is a bisect into one of
+    the sorted lists, so it stays fast however big the roster gets."""
+
+    def __init__(self, students=()):
+        # (students, byFirst, byLast): the (FirstName, LastName, Grade) rows and
+        # the lowercased names to search on, swapped in together by load() so a
+        # suggest() running alongside it never mixes old and new
+        self._index = ([], [], [])
+        self.load(students)
+
+    def __len__(self):
+        return len(self.students)
+
+    @property
+    def students(self):
+        return self._index[0]
+
+    def load(self, students):
+        """Replaces the index with (FirstName, LastName, Grade) rows"""
+        students = [tuple(student) for student in students]
+        byFirst = sorted(
+            (first.lower(), last.lower(), i)
+            for i, (first, last, grade) in enumerate(students)
+        )
+        byLast = sorted(
+            (last.lower(), first.lower(), i)
+            for i, (first, last, grade) in enumerate(students)
+        )
+        self._index = (students, byFirst, byLast)
+
+    @staticmethod
+    def _prefixed(keys, prefix):
+        start = bisect.bisect_left(keys, (prefix,))
+        for i in range(start, len(keys)):
+            if not keys[i][0].startswith(prefix):
+                break
+            yield keys[i]
+
+    def suggest(self, first="", last="", grade=None, limit=8):
+        """(FirstName, LastName, Grade) of students whose names start with first
+        and last, in alphabetical order, just from grade if it's given"""
+        first, last = first.strip().lower(), last.strip().lower()
+        if not (first or last):
+            return []
+        students, byFirst, byLast = self._index
+        # Walk whichever prefix narrows it down more and filter on the other
+        if len(last) > len(first):
+            keys, other = self._prefixed(byLast, last), first
+        else:
+            keys, other = self._prefixed(byFirst, first), last
+        found = []
+        for _, otherName, i in keys:
+            student = students[i]
+            if otherName.startswith(other) and grade in (None, student[2]):
+                found.append(student)
+                if limit is not None and len(found) >= limit:
+                    break
+        return found
+
+    def __contains__(self, student):
+        first, last, grade = student
+        wanted = (first.strip().lower(), last.strip().lower())
+        return any(
+            (found[0].lower(), found[1].lower()) == wanted
+            for found in self.suggest(first, last, grade, limit=None)
+        )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: roster.py students.csv [database]")
+        exit(1)
+    target = sys.argv[2] if len(sys.argv) > 2 else "data.db"
+    migrations.migrate(target)
+    with open(sys.argv[1], newline="", encoding="utf-8-sig") as rosterFile:
+        print(f"Imported {importRoster(rosterFile, target)} students into {target}")
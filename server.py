@@ -0,0 +1,209 @@
+#!/bin/env python3
+"""Shares one data.db between the kiosks at every entrance.
+
+The server owns data.db and its journal. Kiosks started with KIOSK_SERVER set
+(see client.py) send it JSON over HTTP instead of opening the database, and
+print their own slips. Requests are
+
+    POST /call   {"method": "searchVisitors", "args": ["jane doe"]}
+    POST /batch  [{"method": ...}, ...]
+
+answered with {"result": ...} or {"error": "...", "type": "ValidationError"},
+or a list of those for a batch, in order. Only the Kiosk methods in METHODS
+can be called.
+
+Connections are HTTP/1.1 keep-alive, so a kiosk opens one and reuses it for
+every request. Each connection gets a thread. Reads run side by side on the
+database's connection pool; writes from every thread take turns on its one
+writer connection, and sign ins arriving together share a journal fsync.
+
+Run `python server.py [--host H] [--port P] [--database data.db]` on the
+machine with data.db. It only listens on this machine unless --host says
+otherwise, and then KIOSK_SERVER_KEY (or --key) has to be set, on the server
+and every kiosk, to turn away requests from anything else on the network.
+Adding admins and clearing the past are left to cli.py on this machine."""
+import argparse
+import hmac
+import http.server
+import ipaddress
+import json
+import logging
+import os
+import sqlite3
+import threading
+import types
+
+import core
+import database
+import migrations
+
+DEFAULT_PORT = 8765
+# Kiosks that go quiet this long are dropped; they reconnect on their next request
+IDLE_TIMEOUT = 300
+MAX_REQUEST = 4 * 1024 * 1024
+RECOVER_SECONDS = 60
+ARCHIVE_SECONDS = 24 * 60 * 60
+KEY_HEADER = "X-Kiosk-Key"
+METHODS = {
+    "submitRecord",
+    "findVisitor",
+    "findVisitors",
+    "searchVisitors",
+    "currentVisitors",
+    "dataVersion",
+    "countPastVisitors",
+    "pastVisitorsPage",
+    "iterCurrentVisitors",
+    "addStudentEvent",
+    "studentEvents",
+    "rosterStudents",
+    "suggestStudents",
+    "importRoster",
+    "dailyVisits",
+    "hourlyVisits",
+    "studentsByGrade",
+    "rebuildAnalytics",
+    "adminNames",
+    "checkLogin",
+}
+
+
+def callKiosk(kiosk: core.Kiosk, call):
+    """Runs one {"method", "args", "kwargs"} call and returns its reply"""
+    try:
+        method = call["method"]
+        if method not in METHODS:
+            raise ValueError(f"{method!r} can't be called remotely")
+        result = getattr(kiosk, method)(*call.get("args", ()), **call.get("kwargs", {}))
+        if isinstance(result, types.GeneratorType):
+            # Only short ones are in METHODS, so they go back as one list
+            result = list(result)
+        return {"result": result}
+    except core.ValidationError as e:
+        return {"error": str(e), "type": "ValidationError"}
+    except sqlite3.Error as e:
+        logging.error("%s failed: %s", call, e)
+        return {"error": str(e), "type": "DatabaseError"}
+    except (KeyError, TypeError, ValueError) as e:
+        return {"error": f"Bad call {call!r}: {e}", "type": "BadRequest"}
+    except Exception as e:
+        # A reply either way, so the kiosk isn't left waiting on a dropped connection
+        logging.exception("%s failed", call)
+        return {"error": f"{type(e).__name__}: {e}", "type": "ServerError"}
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps the connection open between requests
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    timeout = IDLE_TIMEOUT
+
+    def do_POST(self):
+        key = self.server.key
+        if key and not hmac.compare_digest(self.headers.get(KEY_HEADER, ""), key):
+            # The body is never read, so the connection can't be reused
+            self.close_connection = True
+            return self.reply(403, {"error": "Wrong key", "type": "Forbidden"})
+        length = int(self.headers.get("Content-Length", 0))
+        if length > MAX_REQUEST:
+            self.close_connection = True
+            return self.reply(413, {"error": "Request too big", "type": "BadRequest"})
+        try:
+            body = json.loads(self.rfile.read(length))
+        except ValueError:
+            return self.reply(400, {"error": "Request isn't JSON", "type": "BadRequest"})
+        if self.path == "/call" and isinstance(body, dict):
+            self.reply(200, callKiosk(self.server.kiosk, body))
+        elif self.path == "/batch" and isinstance(body, list):
+            self.reply(200, [callKiosk(self.server.kiosk, call) for call in body])
+        else:
+            self.reply(404, {"error": f"Nothing at {self.path}", "type": "BadRequest"})
+
+    def reply(self, status: int, payload):
+        data = json.dumps(payload, separators=(",", ":")).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logging.debug("%s %s", self.address_string(), format % args)
+
+
+class KioskServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    # Room for every kiosk to connect at once when the server comes back up
+    request_queue_size = 128
+
+    def __init__(self, address, kiosk: core.Kiosk, key=""):
+        super().__init__(address, Handler)
+        self.kiosk = kiosk
+        self.key = key
+        self._stopped = threading.Event()
+        self._upkeep = threading.Thread(target=self._runUpkeep, name="upkeep", daemon=True)
+
+    def serve_forever(self, poll_interval=0.5):
+        self._upkeep.start()
+        super().serve_forever(poll_interval)
+
+    def server_close(self):
+        self._stopped.set()
+        super().server_close()
+
+    def _runUpkeep(self):
+        # The jobs each kiosk used to run for its own data.db
+        sinceArchive = ARCHIVE_SECONDS
+        while True:
+            try:
+                self.kiosk.recover()
+                if sinceArchive >= ARCHIVE_SECONDS:
+                    self.kiosk.archiveHistory()
+                    sinceArchive = 0
+            except (sqlite3.Error, OSError) as e:
+                logging.error("Server upkeep failed, will try again: %s", e)
+            if self._stopped.wait(RECOVER_SECONDS):
+                return
+            sinceArchive += RECOVER_SECONDS
+
+
+def isLoopback(host: str):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def makeParser():
+    parser = argparse.ArgumentParser(description="Share one database between kiosks")
+    parser.add_argument("--host", default="127.0.0.1", help="0.0.0.0 to serve the whole network")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--database", default="data.db")
+    parser.add_argument("--key", default=os.environ.get("KIOSK_SERVER_KEY", ""))
+    return parser
+
+
+def main(argv=None):
+    parser = makeParser()
+    args = parser.parse_args(argv)
+    if not (args.key or isLoopback(args.host)):
+        parser.error("set --key or KIOSK_SERVER_KEY to serve other computers")
+    migrations.migrate(args.database)
+    kiosk = core.Kiosk(args.database)
+    kiosk.loadAdmins()
+    kiosk.loadRoster()
+    server = KioskServer((args.host, args.port), kiosk, args.key)
+    logging.warning("Serving %s on %s:%s", args.database, *server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        database.closeAll()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 #!/bin/bash
 sudo chown root:root intermediary.py
 sudo chown root:root writer.py
+sudo chown root:root printerd.py
 sudo chmod 4775 intermediary.py
 sudo chmod +x main.py
 
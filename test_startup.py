@@ -0,0 +1,33 @@
+"""Keeps `import main` quick and free of side effects; see bench.py startup.
+
+Run with `python -m unittest` (or pytest) from the kiosk's directory."""
+import os
+import tempfile
+import unittest
+
+import bench
+
+
+class StartupTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def testImportStartsNothing(self):
+        threads = bench.runPython(
+            self.directory, "-c", "import main, threading; print([t.name for t in threading.enumerate()])"
+        ).stdout.strip()
+        self.assertEqual(threads, "['MainThread']")
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def testImportIsLazy(self):
+        self.assertEqual(bench.eagerModules(self.directory), "[]")
+
+    def testImportIsQuick(self):
+        best = bench.importTime(self.directory)
+        self.assertLessEqual(best * 1000, bench.STARTUP_BUDGET_MS)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,13 @@
-# noInspection PyUnusedImports
-from tkinter import *
-from tkinter.ttk import *
-from tkinter import Button, OptionMenu
-from tksheet import Sheet
+# noInspection PyUnusedImports
+from tkinter import *
+from tkinter.ttk import *
+from tkinter import Button, OptionMenu
+
+
+def __getattr__(name):
+    # tksheet is slow to import and only the admin viewers use it
+    if name == "Sheet":
+        from tksheet import Sheet
+
+        return Sheet
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
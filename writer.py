@@ -2,17 +2,24 @@
 import sys
 import base64
 import os
+import re
+
+# Runs as root under sudo, so nothing is imported from the kiosk's own files
+DEVICE = "/dev/usb/lp0"
+# and only ever writes to a USB printer, whatever it's asked for
+ALLOWED = re.compile(r"/dev/usb/lp[0-9]+")
 
 data = base64.b64decode(sys.argv[1])
+DEVICE = sys.argv[2] if len(sys.argv) > 2 else DEVICE
 
-if not os.path.exists("/dev/usb/lp0"):
+if not ALLOWED.fullmatch(DEVICE) or not os.path.exists(DEVICE):
     exit(1)
 
-with open("/dev/usb/lp0", "wb") as printer:
+with open(DEVICE, "wb") as printer:
     printer.write(data)
 
 exit(0)
 # Final check (too complicated so skipped)
-with open("/dev/usb/lp0") as nothing:
+with open(DEVICE) as nothing:
     if printer.read(len(data)) == data:
         exit(1)